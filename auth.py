@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# Password hashing settings; raise AUTH_KDF_ITERATIONS as hardware gets faster. Stored hashes keep
+# their own iteration count, so existing users still log in after a change.
+ALGORITHM = 'pbkdf2_sha256'
+ITERATIONS = int(os.environ.get('AUTH_KDF_ITERATIONS', '200000'))
+SALT_BYTES = 16
+
+# Signed session tokens, so reruns and page changes do not go back to the database
+TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL', '3600'))
+_SECRET = os.environ.get('AUTH_SECRET', '').encode() or secrets.token_bytes(32)
+
+# The KDF runs on a small, bounded pool so a burst of logins cannot take every core
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('AUTH_KDF_WORKERS', '2')), thread_name_prefix='kdf')
+
+# Index used for the username lookup, per database dialect (see db_pool.Backend.dialect)
+USERNAME_INDEX_SQL = {
+    'sqlserver': "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_Users_Username') "
+                 "CREATE UNIQUE INDEX IX_Users_Username ON Users (Username)",
+    'sqlite': "CREATE UNIQUE INDEX IF NOT EXISTS IX_Users_Username ON Users (Username)",
+}
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+# Function to hash a password as 'pbkdf2_sha256$<iterations>$<salt>$<hash>'
+def hash_password(password, iterations=ITERATIONS):
+    salt = os.urandom(SALT_BYTES)
+    return f"{ALGORITHM}${iterations}${_b64(salt)}${_b64(_pbkdf2(password, salt, iterations))}"
+
+
+# Hash checked when the username does not exist, so unknown users cost the same as wrong passwords.
+# It is created on first use rather than at import, which would add a full KDF run to every startup.
+@lru_cache(maxsize=None)
+def _dummy_hash():
+    return hash_password(secrets.token_hex(8))
+
+
+# Function to check a password against a stored value. Values that are not hashes are rows written
+# before hashing was introduced and are compared as plaintext; needs_rehash tells the caller to upgrade them.
+def verify_password(password, stored):
+    if not stored.startswith(ALGORITHM + '$'):
+        _verify_hash(password, _dummy_hash())
+        return hmac.compare_digest(password.encode(), stored.encode())
+    return _verify_hash(password, stored)
+
+
+# Function to check a password against a 'pbkdf2_sha256$...' value. A value that does not parse (e.g. a
+# truncated or hand-edited row) fails the check like a wrong password, after the same KDF work.
+def _verify_hash(password, stored):
+    try:
+        _, iterations, salt, expected = stored.split('$')
+        return hmac.compare_digest(_pbkdf2(password, _unb64(salt), int(iterations)), _unb64(expected))
+    except ValueError:
+        _verify_hash(password, _dummy_hash())
+        return False
+
+
+def needs_rehash(stored):
+    return not stored.startswith(f"{ALGORITHM}${ITERATIONS}$")
+
+
+# Function to create the unique index on Users.Username if it does not exist
+def ensure_username_index(pool):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(USERNAME_INDEX_SQL[pool.backend.dialect])
+        conn.commit()
+
+
+# Function to create a new user with a salted password hash; returns False if the username is taken
+def create_user(pool, username, password):
+    password_hash = _executor.submit(hash_password, password).result()
+    try:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO Users (Username, Password) VALUES (?, ?)", (username, password_hash))
+            conn.commit()
+    except pool.backend.integrity_error():
+        return False
+    return True
+
+
+# Function to check user credentials; returns True when they are valid
+def authenticate(pool, username, password):
+    # Indexed lookup by username, fetching only the stored hash
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT Password FROM Users WHERE Username = ?", (username,))
+        row = cursor.fetchone()
+
+    stored = row[0] if row else _dummy_hash()
+    valid = _executor.submit(verify_password, password, stored).result() and row is not None
+    if valid and needs_rehash(stored):
+        new_hash = _executor.submit(hash_password, password).result()
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE Users SET Password = ? WHERE Username = ?", (new_hash, username))
+            conn.commit()
+    return valid
+
+
+def _sign(payload):
+    return _b64(hmac.new(_SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+# Function to issue a signed session token for a user, valid for AUTH_TOKEN_TTL seconds
+def create_token(username, ttl=TOKEN_TTL):
+    payload = f"{_b64(username.encode())}.{int(time.time()) + ttl}"
+    return f"{payload}.{_sign(payload)}"
+
+
+# Function to check a session token; returns the username, or None if it is invalid or expired
+def verify_token(token):
+    if not token:
+        return None
+    try:
+        user, expiry, signature = token.split('.')
+        payload = f"{user}.{expiry}"
+        if not hmac.compare_digest(signature, _sign(payload)) or int(expiry) < time.time():
+            return None
+        return _unb64(user).decode()
+    except ValueError:
+        return None
+
+
+if __name__ == '__main__':
+    import db_pool
+    ensure_username_index(db_pool.create_pool_from_env())
+    print("Users.Username index is in place")
@@ -0,0 +1,74 @@
+import argparse
+import pickle
+
+import numpy as np
+import pandas as pd
+
+import model_registry
+import validation
+
+
+# Function to describe the invalid columns of each row as a semicolon-separated string
+def describe_errors(disease, invalid):
+    columns = np.asarray(validation.columns(disease), dtype=object)
+    errors = np.full(invalid.shape[0], '', dtype=object)
+    for row in np.flatnonzero(invalid.any(axis=1)):
+        errors[row] = ';'.join(columns[invalid[row]])
+    return errors
+
+
+# Function to score a CSV file chunk by chunk and stream the results to an output CSV
+def predict_csv(disease, input_path, output_path, model_path=None, chunksize=100000):
+    columns = validation.columns(disease)
+    if model_path:
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+    else:
+        model = model_registry.get_model(disease)
+
+    total = 0
+    valid_total = 0
+    reader = pd.read_csv(input_path, chunksize=chunksize, encoding='utf-8-sig')
+    with open(output_path, 'w', newline='') as out:
+        for i, chunk in enumerate(reader):
+            missing = [c for c in columns if c not in chunk.columns]
+            if missing:
+                raise ValueError(f"Input file is missing columns: {', '.join(missing)}")
+
+            features = chunk[columns].apply(pd.to_numeric, errors='coerce')
+            invalid = validation.validate(disease, features.to_numpy(dtype=np.float64))
+            valid = ~invalid.any(axis=1)
+
+            # One predict call per chunk, only on the rows that passed validation
+            prediction = np.full(len(chunk), -1, dtype=np.int64)
+            if valid.any():
+                prediction[valid] = model.predict(features[valid])
+
+            result = pd.DataFrame({
+                'row': chunk.index,
+                'prediction': prediction,
+                'valid': valid,
+                'errors': describe_errors(disease, invalid),
+            })
+            result.to_csv(out, header=(i == 0), index=False)
+            total += len(chunk)
+            valid_total += int(valid.sum())
+
+    return total, valid_total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch scoring of CSV files against the tabular disease models.')
+    parser.add_argument('disease', choices=sorted(model_registry.MODELS))
+    parser.add_argument('input', help='CSV file shaped like diabetes.csv, heart.csv or parkinsons.csv')
+    parser.add_argument('output', help='CSV file to write predictions to')
+    parser.add_argument('--model', help='Path to the model file (defaults to the registry model)')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Rows per chunk')
+    args = parser.parse_args(argv)
+
+    total, valid = predict_csv(args.disease, args.input, args.output, args.model, args.chunksize)
+    print(f"Scored {valid} of {total} rows ({total - valid} failed validation) -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Training CSV of each tabular predictor, used as the source of benchmark rows
+DATASETS = {
+    'diabetes': 'diabetes.csv',
+    'heart': 'heart.csv',
+    'parkinsons': 'parkinsons.csv',
+}
+PREDICTORS = list(DATASETS) + ['covid']
+
+
+# Function to get the peak resident set size of this process in MB
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# Function to time single-row requests; returns latency percentiles in milliseconds.
+# `reset` (e.g. clearing the prediction cache) runs before each request and is not timed.
+def measure_latency(predict, rows, iterations, reset=None):
+    timings = np.empty(iterations)
+    for i in range(iterations):
+        row = rows[i % len(rows):i % len(rows) + 1]
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        predict(row)
+        timings[i] = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(timings * 1000, [50, 95, 99])
+    return {'iterations': iterations, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'mean_ms': timings.mean() * 1000}
+
+
+# Function to measure throughput (rows per second) for each batch size; `reset` runs untimed before each batch
+def measure_throughput(predict, rows, batch_sizes, min_time, reset=None):
+    results = {}
+    for batch_size in batch_sizes:
+        batch = [rows[i % len(rows)] for i in range(batch_size)]
+        batch = np.stack(batch) if isinstance(rows, np.ndarray) else batch
+        predict(batch)  # warm-up
+        count = 0
+        elapsed = 0.0
+        while elapsed < min_time:
+            if reset is not None:
+                reset()
+            start = time.perf_counter()
+            predict(batch)
+            elapsed += time.perf_counter() - start
+            count += batch_size
+        results[str(batch_size)] = {'rows_per_second': count / elapsed, 'ms_per_batch': 1000 * elapsed * batch_size / count}
+    return results
+
+
+# Function to sample feature rows from a training CSV. Only rows that pass validation are used, since the
+# others never reach the model.
+def sample_rows(disease, n, seed):
+    import pandas as pd
+    import validation
+    data = pd.read_csv(DATASETS[disease], encoding='utf-8-sig')[validation.columns(disease)]
+    data = data[~validation.validate(disease, data.to_numpy(dtype=np.float64)).any(axis=1)]
+    return data.sample(n=n, replace=len(data) < n, random_state=seed).to_numpy(dtype=np.float64)
+
+
+# Function to encode n random RGB images as PNG bytes, like uploads
+def sample_images(n, seed):
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(n):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)).save(buffer, format='PNG')
+        images.append(buffer.getvalue())
+    return images
+
+
+# Function to benchmark one predictor inside the current (fresh) process, through the predictors entry points the
+# app and REST service call (validation, prediction cache and, for X-rays, decoding and micro-batching included)
+def run_predictor(name, iterations, batch_sizes, min_time, seed):
+    result = {'predictor': name}
+    # Cold start covers importing the serving modules and loading the model
+    start = time.perf_counter()
+    import predictors
+    if name == 'covid':
+        import covid_model
+        predictors.get_covid_classifier()
+        result['cold_start_s'] = time.perf_counter() - start
+        result['artifact'] = covid_model.classifier_version()
+        rows = sample_images(max(batch_sizes), seed)
+        predict = predictors.classify_images
+    else:
+        import model_registry
+        model_registry.get_model(name)
+        result['cold_start_s'] = time.perf_counter() - start
+        result['artifact'] = model_registry.get_version(name)
+        rows = sample_rows(name, max(max(batch_sizes), 1000), seed)
+
+        def predict(batch):
+            return predictors.predict_tabular(name, batch)
+    clear_cache = predictors.get_cache().clear
+
+    start = time.perf_counter()
+    predict(rows[:1])
+    result['first_prediction_ms'] = 1000 * (time.perf_counter() - start)
+    # Every request computed, then the same requests answered from the prediction cache
+    result['latency'] = measure_latency(predict, rows, iterations, reset=clear_cache)
+    predict(rows[:1])
+    result['latency_cached'] = measure_latency(predict, rows[:1], iterations)
+    result['throughput'] = measure_throughput(predict, rows, batch_sizes, min_time, reset=clear_cache)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+# Function to benchmark a predictor in a child process, so cold start and peak RSS are not shared between predictors
+def run_isolated(name, args):
+    iterations = args.image_iterations if name == 'covid' else args.iterations
+    command = [sys.executable, os.path.abspath(__file__), '--isolated', name,
+               '--iterations', str(iterations), '--min-time', str(args.min_time), '--seed', str(args.seed),
+               '--batch-sizes'] + [str(b) for b in (args.image_batch_sizes if name == 'covid' else args.batch_sizes)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {'predictor': name, 'error': completed.stderr.strip().splitlines()[-1] if completed.stderr else 'failed'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark load time, latency, throughput and memory of the predictors.')
+    parser.add_argument('predictors', nargs='*', help=f"Predictors to benchmark: {', '.join(PREDICTORS)} (default: all)")
+    parser.add_argument('--iterations', type=int, default=1000, help='Single-row requests timed per tabular predictor')
+    parser.add_argument('--image-iterations', type=int, default=50, help='Single-image requests timed for covid')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 128, 1024, 8192])
+    parser.add_argument('--image-batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds spent on each throughput measurement')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file to write results to')
+    parser.add_argument('--isolated', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    unknown = set(args.predictors) - set(PREDICTORS)
+    if unknown:
+        parser.error(f"unknown predictors: {', '.join(sorted(unknown))}")
+
+    if args.isolated:
+        result = run_predictor(args.isolated, args.iterations, args.batch_sizes, args.min_time, args.seed)
+        print(json.dumps(result))
+        return
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': [run_isolated(name, args) for name in (args.predictors or PREDICTORS)],
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for result in report['results']:
+        if 'error' in result:
+            print(f"{result['predictor']:<11} error: {result['error']}")
+        else:
+            latency = result['latency']
+            print(f"{result['predictor']:<11} cold start {result['cold_start_s']:.2f}s  "
+                  f"p50 {latency['p50_ms']:.3f}ms  p99 {latency['p99_ms']:.3f}ms  "
+                  f"cached p50 {result['latency_cached']['p50_ms']:.3f}ms  peak RSS {result['peak_rss_mb']:.0f}MB")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import pickle
+
+import numpy as np
+
+import model_registry
+
+METHODS = ('platt', 'isotonic')
+
+
+# Maps raw decision_function scores to calibrated probabilities with NumPy only.
+#   method='platt'    - params = [a, b], p = 1 / (1 + exp(a * score + b))
+#   method='isotonic' - params = [[score thresholds], [probabilities]], piecewise-linear between thresholds
+# `threshold` is the operating point: risks at or above it are flagged positive.
+class Calibrator:
+    def __init__(self, method, params, threshold=0.5):
+        if method not in METHODS:
+            raise ValueError(f"Unknown calibration method '{method}'")
+        self.method = method
+        self.params = np.asarray(params, dtype=np.float64)
+        self.threshold = float(threshold)
+
+    # Function to turn a batch of scores into probabilities of the positive class in one vectorized call
+    def predict_proba(self, scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        if self.method == 'platt':
+            a, b = self.params
+            return 1.0 / (1.0 + np.exp(np.clip(a * scores + b, -500, 500)))
+        return np.interp(scores, self.params[0], self.params[1])
+
+    def save(self, path):
+        np.savez(path, method=self.method, params=self.params, threshold=np.array([self.threshold]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(str(data['method']), data['params'], float(data['threshold'][0]))
+
+
+# Function to fit Platt scaling with Newton's method, using Platt's smoothed targets so the
+# probabilities never reach exactly 0 or 1 on small datasets
+def fit_platt(scores, labels, iterations=100, tol=1e-10):
+    scores = np.asarray(scores, dtype=np.float64)
+    labels = np.asarray(labels)
+    n_pos = np.count_nonzero(labels == 1)
+    n_neg = len(labels) - n_pos
+    targets = np.where(labels == 1, (n_pos + 1.0) / (n_pos + 2.0), 1.0 / (n_neg + 2.0))
+    a, b = 0.0, np.log((n_neg + 1.0) / (n_pos + 1.0))
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(np.clip(a * scores + b, -500, 500)))
+        grad = targets - p  # derivative of the log loss w.r.t. a * score + b
+        weights = np.maximum(p * (1.0 - p), 1e-12)
+        hessian = np.array([[np.dot(weights, scores * scores), np.dot(weights, scores)],
+                            [np.dot(weights, scores), weights.sum()]]) + 1e-12 * np.eye(2)
+        step = np.linalg.solve(hessian, [np.dot(grad, scores), grad.sum()])
+        a, b = a - step[0], b - step[1]
+        if np.abs(step).max() < tol:
+            break
+    return np.array([a, b])
+
+
+# Function to fit isotonic regression (sklearn, offline only) and keep its step points
+def fit_isotonic(scores, labels):
+    from sklearn.isotonic import IsotonicRegression
+    iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(scores, labels)
+    return np.vstack([iso.X_thresholds_, iso.y_thresholds_])
+
+
+# Function to pick an operating threshold from every candidate at once (sorted cumulative counts).
+# With min_sensitivity the highest threshold reaching that sensitivity is used, otherwise the one
+# that maximizes Youden's J (sensitivity + specificity - 1).
+def tune_threshold(probabilities, labels, min_sensitivity=None):
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    labels = np.asarray(labels) == 1
+    order = np.argsort(-probabilities, kind='stable')
+    p, y = probabilities[order], labels[order]
+    # Predicting positive for everything down to position i; only the last of tied probabilities is a real cut
+    last = np.r_[p[1:] != p[:-1], True]
+    tpr = np.cumsum(y)[last] / max(y.sum(), 1)
+    fpr = np.cumsum(~y)[last] / max((~y).sum(), 1)
+    candidates = p[last]
+    if min_sensitivity is not None:
+        return float(candidates[np.argmax(tpr >= min_sensitivity)])
+    return float(candidates[np.argmax(tpr - fpr)])
+
+
+# Function to get the calibration file stored next to a disease's .sav model
+def calibration_path(disease, model_dir='.'):
+    return model_registry.model_path(disease, '.calibration.npz', model_dir)
+
+
+# Function to fit a calibrator for a disease on out-of-fold decision scores of its model (the model is
+# refitted on cross-validation folds, as CalibratedClassifierCV(ensemble=False) does), so the scores are
+# never from rows the scorer saw; returns (calibrator, out-of-fold probabilities, labels)
+def fit_calibrator(disease, model=None, method='platt', cv=5, min_sensitivity=None, seed=2):
+    from sklearn.base import clone
+    from sklearn.model_selection import StratifiedKFold, cross_val_predict
+
+    import train
+    if model is None:
+        with open(model_registry.model_path(disease, '.sav'), 'rb') as f:
+            model = pickle.load(f)
+    X, Y = train.load_dataset(disease)
+    scores = cross_val_predict(clone(model), X, Y, method='decision_function',
+                               cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed))
+    params = fit_platt(scores, Y) if method == 'platt' else fit_isotonic(scores, Y)
+    calibrator = Calibrator(method, params)
+    probabilities = calibrator.predict_proba(scores)
+    calibrator.threshold = tune_threshold(probabilities, Y, min_sensitivity)
+    return calibrator, probabilities, np.asarray(Y)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit probability calibration for the tabular models.')
+    parser.add_argument('diseases', nargs='*', help=f"Diseases to calibrate: {', '.join(model_registry.MODELS)} (default: all)")
+    parser.add_argument('--method', choices=METHODS, default='platt')
+    parser.add_argument('--cv', type=int, default=5, help='Cross-validation folds for the out-of-fold scores')
+    parser.add_argument('--min-sensitivity', type=float, default=None,
+                        help='Pick the threshold reaching this sensitivity instead of maximizing Youden J')
+    args = parser.parse_args(argv)
+    unknown = set(args.diseases) - set(model_registry.MODELS)
+    if unknown:
+        parser.error(f"unknown diseases: {', '.join(sorted(unknown))}")
+
+    for disease in args.diseases or model_registry.MODELS:
+        calibrator, probabilities, labels = fit_calibrator(
+            disease, method=args.method, cv=args.cv, min_sensitivity=args.min_sensitivity)
+        path = calibration_path(disease)
+        calibrator.save(path)
+        brier = float(np.mean((probabilities - labels) ** 2))
+        print(f"{disease:<11} {args.method}  Brier {brier:.4f}  threshold {calibrator.threshold:.3f}  -> {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import covid_model
+
+# Files of a decoded dataset cache
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.npy'
+MANIFEST_FILE = 'manifest.json'
+SPLITS = ('train', 'val', 'test')
+
+
+# Function to list (path, class index) for a directory with one sub-directory per class. Both the organized
+# layout (Lung_Opacity/x.png) and the original radiography dataset layout (Lung_Opacity/images/x.png) work,
+# so the images no longer need to be copied into a separate folder first.
+def list_dataset(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        label = name.replace('_', ' ')
+        class_dir = os.path.join(directory, name)
+        if label not in covid_model.CLASS_NAMES or not os.path.isdir(class_dir):
+            continue
+        if os.path.isdir(os.path.join(class_dir, 'images')):
+            class_dir = os.path.join(class_dir, 'images')
+        index = covid_model.CLASS_NAMES.index(label)
+        images.extend((path, index) for path in covid_model.list_images(class_dir))
+    return images
+
+
+def _decode_into(path, out):
+    with Image.open(path) as image:
+        out[...] = covid_model.resize_image(image)
+
+
+# Function to split images per class (stratified) and order them so each split is one contiguous,
+# shuffled range; returns (ordered images, {split: (start, stop)})
+def _stratified_order(images, val_fraction, test_fraction, seed):
+    rng = random.Random(seed)
+    parts = {split: [] for split in SPLITS}
+    for index in range(len(covid_model.CLASS_NAMES)):
+        members = [image for image in images if image[1] == index]
+        rng.shuffle(members)
+        n_test = int(round(len(members) * test_fraction))
+        n_val = int(round(len(members) * val_fraction))
+        parts['test'] += members[:n_test]
+        parts['val'] += members[n_test:n_test + n_val]
+        parts['train'] += members[n_test + n_val:]
+    ordered, bounds = [], {}
+    for split in SPLITS:
+        rng.shuffle(parts[split])
+        bounds[split] = (len(ordered), len(ordered) + len(parts[split]))
+        ordered += parts[split]
+    return ordered, bounds
+
+
+# Function to decode and resize every image once into a memory-mapped uint8 array on disk.
+# Per-split class counts go into the manifest so nothing has to scan the images to get them.
+def build_cache(data_dir, cache_dir, val_fraction=0.2, test_fraction=0.1, seed=42, workers=None):
+    images = list_dataset(data_dir)
+    if not images:
+        raise ValueError(f"No labelled images found in {data_dir}")
+    images, bounds = _stratified_order(images, val_fraction, test_fraction, seed)
+    n = len(images)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    pixels = np.lib.format.open_memmap(os.path.join(cache_dir, IMAGES_FILE), mode='w+', dtype=np.uint8,
+                                       shape=(n,) + covid_model.IMAGE_SIZE + (3,))
+    labels = np.array([label for _, label in images], dtype=np.int64)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_decode_into, [path for path, _ in images], pixels))
+    pixels.flush()
+    del pixels
+    np.save(os.path.join(cache_dir, LABELS_FILE), labels)
+
+    manifest = {
+        'source': os.path.abspath(data_dir),
+        'image_size': list(covid_model.IMAGE_SIZE),
+        'class_names': covid_model.CLASS_NAMES,
+        'seed': seed,
+        'size': n,
+        'splits': {
+            split: {
+                'start': lo,
+                'stop': hi,
+                'class_counts': np.bincount(labels[lo:hi], minlength=len(covid_model.CLASS_NAMES)).tolist(),
+            }
+            for split, (lo, hi) in bounds.items()
+        },
+        'build_seconds': time.perf_counter() - start,
+    }
+    with open(os.path.join(cache_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(cache_dir):
+    with open(os.path.join(cache_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+# Function to get {class index: weight} that balances the classes of a split, for model.fit(class_weight=...)
+def class_weights(manifest, split='train'):
+    counts = np.asarray(manifest['splits'][split]['class_counts'], dtype=np.float64)
+    weights = counts.sum() / (len(counts) * np.maximum(counts, 1))
+    return {i: float(w) for i, w in enumerate(weights)}
+
+
+# Function to stream one split of a cache as a tf.data.Dataset of (float32 images, int64 labels) batches.
+# Only indices are shuffled; each batch is gathered from the memory-mapped file on parallel map calls
+# and prefetched, so epochs never decode or resize an image. Pixel values are in [0, 255], like the
+# image_dataset_from_directory pipeline the model was trained with (EfficientNet rescales internally).
+def make_dataset(cache_dir, split='train', batch_size=64, shuffle=None, seed=42, augment=None):
+    import tensorflow as tf
+
+    manifest = load_manifest(cache_dir)
+    start, stop = manifest['splits'][split]['start'], manifest['splits'][split]['stop']
+    pixels = np.load(os.path.join(cache_dir, IMAGES_FILE), mmap_mode='r')
+    labels = np.load(os.path.join(cache_dir, LABELS_FILE), mmap_mode='r')
+    if shuffle is None:
+        shuffle = split == 'train'
+
+    def gather(indices):
+        indices = np.sort(indices)  # sequential reads from the memory map
+        return pixels[indices], labels[indices]
+
+    def load_batch(indices):
+        images, targets = tf.numpy_function(gather, [indices], (tf.uint8, tf.int64))
+        images.set_shape((None,) + covid_model.IMAGE_SIZE + (3,))
+        targets.set_shape((None,))
+        return tf.cast(images, tf.float32), targets
+
+    dataset = tf.data.Dataset.range(start, stop)
+    if shuffle:
+        dataset = dataset.shuffle(stop - start, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(load_batch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if augment is not None:
+        dataset = dataset.map(lambda x, y: (augment(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decoded X-ray dataset cache for retraining the COVID-19 model.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Decode and resize a class-per-folder image dataset once')
+    build.add_argument('data_dir', help='Directory with one sub-directory per class')
+    build.add_argument('cache_dir', help='Directory to write images.npy, labels.npy and manifest.json to')
+    build.add_argument('--val', type=float, default=0.2, help='Fraction of images used for validation')
+    build.add_argument('--test', type=float, default=0.1, help='Fraction of images used for testing')
+    build.add_argument('--seed', type=int, default=42)
+    build.add_argument('--workers', type=int, default=None, help='Threads used to decode images')
+    stats = commands.add_parser('stats', help='Print the class statistics of a cache')
+    stats.add_argument('cache_dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        manifest = build_cache(args.data_dir, args.cache_dir, args.val, args.test, args.seed, args.workers)
+        print(f"Cached {manifest['size']} images in {manifest['build_seconds']:.1f}s -> {args.cache_dir}")
+    else:
+        manifest = load_manifest(args.cache_dir)
+    for split in SPLITS:
+        counts = manifest['splits'][split]['class_counts']
+        summary = ', '.join(f"{name}: {count}" for name, count in zip(manifest['class_names'], counts))
+        print(f"{split:<5} {sum(counts):>6}  ({summary})")
+
+
+if __name__ == '__main__':
+    main()
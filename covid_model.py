@@ -0,0 +1,191 @@
+import argparse
+import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Output classes of the EfficientNetB0 model, in softmax order
+CLASS_NAMES = ["Normal", "Lung Opacity", "Viral Pneumonia", "COVID"]
+IMAGE_SIZE = (224, 224)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+# Function to load the trained Keras model
+def load_model(path="covid.h5"):
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
+
+
+# Function to decode and resize an image to 224x224; returns a uint8 array of shape (224, 224, 1) for
+# grayscale images or (224, 224, 3) otherwise, which broadcasts into an RGB target
+def resize_image(image):
+    # For JPEGs let the decoder downscale by a power of two before the full image is decoded
+    if image.format == 'JPEG':
+        image.draft('L' if image.mode == 'L' else 'RGB', IMAGE_SIZE)
+    if image.mode.startswith(('I', 'F')):  # 16/32-bit grayscale, e.g. DICOM exports; convert() would clip at 255
+        image = _to_8bit(image)
+    elif image.mode not in ('L', 'RGB', 'RGBA'):
+        image = image.convert('RGB')
+    # reducing_gap shrinks large scans with a cheap box reduce before the final resampling pass
+    img = image.resize(IMAGE_SIZE, reducing_gap=3.0)  # Resize to match the input size of the model
+    img_array = np.asarray(img)
+    if img_array.ndim == 2:  # Grayscale image: broadcast the single channel into all 3 RGB channels
+        img_array = img_array[:, :, np.newaxis]
+    elif img_array.shape[2] == 4:  # RGBA image
+        img_array = img_array[:, :, :3]  # Drop the alpha channel
+    return img_array
+
+
+# Function to rescale a high bit-depth grayscale image from its own min/max to an 8-bit 'L' image,
+# so 12-bit data stored in 16 bits uses the full range as well
+def _to_8bit(image):
+    pixels = np.asarray(image, dtype=np.float32)
+    low, high = float(pixels.min()), float(pixels.max())
+    scale = 255.0 / (high - low) if high > low else 0.0
+    return Image.fromarray(((pixels - low) * scale).round().astype(np.uint8), mode='L')
+
+
+# Function to preprocess the uploaded image into a (1, 224, 224, 3) float32 array scaled to [0, 1].
+# `out` may be any float32 array of shape (224, 224, 3) or (1, 224, 224, 3) to write into, e.g. a slot of a batch.
+def preprocess_image(image, out=None):
+    if out is None:
+        out = np.empty((1,) + IMAGE_SIZE + (3,), dtype=np.float32)
+    target = out.reshape(IMAGE_SIZE + (3,))
+    np.multiply(resize_image(image), np.float32(1 / 255.0), out=target)  # Normalize pixel values to [0, 1] in place
+    return out
+
+
+# Function to open and preprocess one image file (path or file-like object) into a (224, 224, 3) array
+def load_image(source, out=None):
+    if out is None:
+        out = np.empty(IMAGE_SIZE + (3,), dtype=np.float32)
+    with Image.open(source) as image:
+        preprocess_image(image, out)
+    return out
+
+
+# Function to decode many images in parallel into one (n, 224, 224, 3) array; PIL releases the GIL while decoding
+def load_images(sources, workers=None):
+    sources = list(sources)
+    images = np.empty((len(sources),) + IMAGE_SIZE + (3,), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(load_image, sources, images))
+    return images
+
+
+# Runs the Keras model batch by batch through a single compiled tf.function
+class BatchClassifier:
+    def __init__(self, model, batch_size=32):
+        import tensorflow as tf
+        self.model = model
+        self.batch_size = batch_size
+        # A fixed input signature means the function is traced once and reused for every batch size
+        self._forward = tf.function(
+            lambda x: _forward_with_features(model, x),
+            input_signature=[tf.TensorSpec((None,) + IMAGE_SIZE + (3,), tf.float32)],
+        )
+
+    # Function to classify a sequence of preprocessed images; returns a (n, classes) probability array
+    def predict(self, images):
+        return self.predict_with_embeddings(images)[0]
+
+    # Function to classify images and keep the pooled EfficientNet features of the same forward pass;
+    # returns ((n, classes) probabilities, (n, features) embeddings)
+    def predict_with_embeddings(self, images):
+        n = len(images)
+        probabilities = np.empty((n, len(CLASS_NAMES)), dtype=np.float32)
+        embeddings = None
+        for start in range(0, n, self.batch_size):
+            end = min(start + self.batch_size, n)
+            batch = np.asarray(images[start:end], dtype=np.float32)
+            outputs, features = self._forward(batch)
+            if embeddings is None:
+                embeddings = np.empty((n, features.shape[-1]), dtype=np.float32)
+            probabilities[start:end] = outputs.numpy()
+            embeddings[start:end] = features.numpy()
+        if embeddings is None:  # no images
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        return probabilities, embeddings
+
+
+# Function to run the model layer by layer and return (probabilities, pooled features). The model is
+# Sequential with the EfficientNetB0 base (include_top=False, pooling='max') as its first layer, so
+# the output of that layer is the image embedding the classification head sees.
+def _forward_with_features(model, x):
+    features = model.layers[0](x, training=False)
+    outputs = features
+    for layer in model.layers[1:]:
+        outputs = layer(outputs, training=False)
+    return outputs, features
+
+
+# Function to create the classifier for the backend selected by the COVID_BACKEND environment variable
+#   COVID_BACKEND=keras (default) - covid.h5 through TensorFlow
+#   COVID_BACKEND=tflite          - covid.tflite through the TFLite interpreter (see covid_tflite.py);
+#                                   COVID_TFLITE_MODEL and COVID_TFLITE_THREADS override path and threads
+def load_classifier(model_path="covid.h5", batch_size=32):
+    if os.environ.get('COVID_BACKEND', 'keras') == 'tflite':
+        import covid_tflite
+        return covid_tflite.TFLiteClassifier(
+            _backend_model_path(model_path),
+            num_threads=int(os.environ.get('COVID_TFLITE_THREADS', '1')),
+            batch_size=batch_size,
+        )
+    return BatchClassifier(load_model(model_path), batch_size)
+
+
+# Function to get the model file used by the selected backend
+def _backend_model_path(model_path):
+    if os.environ.get('COVID_BACKEND', 'keras') == 'tflite':
+        return os.environ.get('COVID_TFLITE_MODEL', 'covid.tflite')
+    return model_path
+
+
+# Function to get the version (backend, model file and modification time) of the classifier load_classifier() returns
+def classifier_version(model_path="covid.h5"):
+    path = _backend_model_path(model_path)
+    mtime = int(os.path.getmtime(path)) if os.path.exists(path) else 0
+    return f"{os.environ.get('COVID_BACKEND', 'keras')}:{os.path.basename(path)}@{mtime}"
+
+
+# Function to list the image files of a directory, sorted by name
+def list_images(directory):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(directory, n) for n in names]
+
+
+# Function to classify every image in a directory and write one CSV row per image
+def classify_directory(directory, output_path, model_path="covid.h5", batch_size=32, workers=None):
+    classifier = load_classifier(model_path, batch_size)
+    paths = list_images(directory)
+    with open(output_path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(['file', 'label'] + CLASS_NAMES)
+        # Decode one chunk of images while keeping memory bounded for very large directories
+        chunk = batch_size * 8
+        for start in range(0, len(paths), chunk):
+            names = paths[start:start + chunk]
+            probabilities = classifier.predict(load_images(names, workers))
+            for name, probs in zip(names, probabilities):
+                label = CLASS_NAMES[int(np.argmax(probs))]
+                writer.writerow([os.path.basename(name), label] + [f"{p:.6f}" for p in probs])
+    return len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch classification of lung X-ray images.')
+    parser.add_argument('directory', help='Directory containing .jpg/.jpeg/.png X-ray images')
+    parser.add_argument('output', help='CSV file to write predictions to')
+    parser.add_argument('--model', default='covid.h5', help='Path to the Keras model')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass')
+    parser.add_argument('--workers', type=int, default=None, help='Threads used to decode images')
+    args = parser.parse_args(argv)
+
+    count = classify_directory(args.directory, args.output, args.model, args.batch_size, args.workers)
+    print(f"Classified {count} images -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+import covid_model
+
+
+# Function to get a TFLite interpreter class, preferring the small tflite-runtime package over full TensorFlow
+def _interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+# Function to list the labelled images of a directory laid out like working/organized_data in the
+# training notebook (one sub-directory per class); returns (path, class index or None) pairs
+def list_labelled_images(directory):
+    class_dirs = {name.replace('_', ' '): name for name in os.listdir(directory)
+                  if os.path.isdir(os.path.join(directory, name))}
+    if not class_dirs:
+        return [(path, None) for path in covid_model.list_images(directory)]
+    images = []
+    for label, name in sorted(class_dirs.items()):
+        index = covid_model.CLASS_NAMES.index(label) if label in covid_model.CLASS_NAMES else None
+        images.extend((path, index) for path in covid_model.list_images(os.path.join(directory, name)))
+    return images
+
+
+# Function to yield calibration samples for int8 quantization, preprocessed exactly like at serving time
+def representative_dataset(directory, num_samples=200, seed=42):
+    images = list_labelled_images(directory)
+    random.Random(seed).shuffle(images)
+    for path, _ in images[:num_samples]:
+        yield [covid_model.load_image(path)[np.newaxis]]
+
+
+# Function to rebuild the Sequential model as a functional one that also outputs the pooled EfficientNet
+# features. The graph is built on a new input with the same forward pass as covid_model.BatchClassifier
+# (the layers and weights are shared), so both backends return the same embeddings.
+def _with_embeddings_output(model):
+    import tensorflow as tf
+    inputs = tf.keras.Input(shape=tuple(covid_model.IMAGE_SIZE) + (3,))
+    outputs, features = covid_model._forward_with_features(model, inputs)
+    return tf.keras.Model(inputs, [outputs, features])
+
+
+# Function to convert the Keras model into a quantized TFLite flatbuffer
+#   mode='dynamic' - weights stored as int8, activations computed in float (no calibration data needed)
+#   mode='int8'    - weights and activations quantized to int8, calibrated on images from calibration_dir
+# With embeddings=True the pooled EfficientNet features are exported as a second output (see similar_cases.py).
+def convert(h5_path="covid.h5", output_path="covid.tflite", mode='dynamic', calibration_dir=None, num_samples=200,
+            embeddings=False):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(h5_path)
+    if embeddings:
+        model = _with_embeddings_output(model)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'int8':
+        if not calibration_dir:
+            raise ValueError("int8 quantization needs a calibration_dir with training images")
+        converter.representative_dataset = lambda: representative_dataset(calibration_dir, num_samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != 'dynamic':
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    with open(output_path, 'wb') as f:
+        f.write(converter.convert())
+    return output_path
+
+
+# Runs a TFLite model with the lightweight interpreter; same predict() interface as covid_model.BatchClassifier
+class TFLiteClassifier:
+    def __init__(self, model_path="covid.tflite", num_threads=1, batch_size=32):
+        self.batch_size = batch_size
+        self._interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        # The probabilities are the output with one value per class; models converted with embeddings=True
+        # also have the pooled features as a second output
+        outputs = self._interpreter.get_output_details()
+        self._output = next(o for o in outputs if o['shape'][-1] == len(covid_model.CLASS_NAMES))
+        self._features = next((o for o in outputs if o['index'] != self._output['index']), None)
+        self._batch = None
+
+    # Function to resize the input tensor when the batch size changes
+    def _ensure_batch(self, n):
+        if self._batch != n:
+            self._interpreter.resize_tensor_input(self._input['index'], [n] + list(covid_model.IMAGE_SIZE) + [3])
+            self._interpreter.allocate_tensors()
+            self._batch = n
+
+    # Function to quantize a float batch if the model has integer inputs
+    def _to_input(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return batch
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    # Function to read an output tensor, converting integer outputs back to floats
+    def _from_output(self, details):
+        output = self._interpreter.get_tensor(details['index'])
+        if details['dtype'] == np.float32:
+            return output
+        scale, zero_point = details['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+    # Function to classify a sequence of preprocessed images; returns a (n, classes) probability array
+    def predict(self, images):
+        return self.predict_with_embeddings(images)[0]
+
+    # Function to classify images and read the pooled features of the same invocation; returns
+    # ((n, classes) probabilities, (n, features) embeddings or None if the model has no features output)
+    def predict_with_embeddings(self, images):
+        n = len(images)
+        probabilities = np.empty((n, len(covid_model.CLASS_NAMES)), dtype=np.float32)
+        embeddings = None if self._features is None else np.empty((n, self._features['shape'][-1]), dtype=np.float32)
+        for start in range(0, n, self.batch_size):
+            end = min(start + self.batch_size, n)
+            batch = np.asarray(images[start:end], dtype=np.float32)
+            self._ensure_batch(end - start)
+            self._interpreter.set_tensor(self._input['index'], self._to_input(batch))
+            self._interpreter.invoke()
+            probabilities[start:end] = self._from_output(self._output)
+            if embeddings is not None:
+                embeddings[start:end] = self._from_output(self._features)
+        return probabilities, embeddings
+
+
+# Function to run both models over the same images and measure agreement, accuracy and speed; for a model
+# converted with embeddings=True also how close its features are to the Keras ones (cosine per image)
+def parity_report(h5_path, tflite_path, image_dir, limit=500, num_threads=1, batch_size=32):
+    images = list_labelled_images(image_dir)[:limit]
+    inputs = covid_model.load_images([path for path, _ in images])
+    labels = np.array([-1 if label is None else label for _, label in images])
+
+    report = {'images': len(images), 'h5_size_bytes': os.path.getsize(h5_path),
+              'tflite_size_bytes': os.path.getsize(tflite_path)}
+    results = {}
+    features = {}
+    for name, classifier in [('h5', covid_model.BatchClassifier(covid_model.load_model(h5_path), batch_size)),
+                             ('tflite', TFLiteClassifier(tflite_path, num_threads, batch_size))]:
+        classifier.predict(inputs[:1])  # warm-up
+        start = time.perf_counter()
+        results[name], features[name] = classifier.predict_with_embeddings(inputs)
+        elapsed = time.perf_counter() - start
+        report[f'{name}_ms_per_image'] = 1000 * elapsed / max(len(inputs), 1)
+
+    h5_labels = results['h5'].argmax(axis=1)
+    tflite_labels = results['tflite'].argmax(axis=1)
+    report['top1_agreement'] = float(np.mean(h5_labels == tflite_labels))
+    report['max_abs_probability_diff'] = float(np.abs(results['h5'] - results['tflite']).max())
+    if features['tflite'] is not None and len(inputs):
+        cosine = (features['h5'] * features['tflite']).sum(axis=1) / np.maximum(
+            np.linalg.norm(features['h5'], axis=1) * np.linalg.norm(features['tflite'], axis=1), 1e-12)
+        report['mean_embedding_cosine'] = float(cosine.mean())
+        report['min_embedding_cosine'] = float(cosine.min())
+        report['max_abs_embedding_diff'] = float(np.abs(features['h5'] - features['tflite']).max())
+    labelled = labels >= 0
+    if labelled.any():
+        report['h5_accuracy'] = float(np.mean(h5_labels[labelled] == labels[labelled]))
+        report['tflite_accuracy'] = float(np.mean(tflite_labels[labelled] == labels[labelled]))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Quantized TFLite export of the COVID-19 X-ray model.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='Convert covid.h5 into a quantized .tflite model')
+    convert_parser.add_argument('--model', default='covid.h5', help='Path to the Keras model')
+    convert_parser.add_argument('--output', default='covid.tflite', help='Path of the TFLite model to write')
+    convert_parser.add_argument('--mode', choices=['dynamic', 'int8'], default='dynamic')
+    convert_parser.add_argument('--calibration-dir', help='Training images, one sub-directory per class (int8 only)')
+    convert_parser.add_argument('--samples', type=int, default=200, help='Number of calibration images')
+    convert_parser.add_argument('--embeddings', action='store_true',
+                                help='Also export the pooled features used for similar-case retrieval')
+
+    report_parser = subparsers.add_parser('report', help='Compare the TFLite model against the Keras model')
+    report_parser.add_argument('image_dir', help='Test images, optionally one sub-directory per class')
+    report_parser.add_argument('--model', default='covid.h5', help='Path to the Keras model')
+    report_parser.add_argument('--tflite', default='covid.tflite', help='Path to the TFLite model')
+    report_parser.add_argument('--limit', type=int, default=500, help='Maximum number of images to compare')
+    report_parser.add_argument('--threads', type=int, default=1, help='TFLite interpreter threads')
+    report_parser.add_argument('--output', help='Write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        path = convert(args.model, args.output, args.mode, args.calibration_dir, args.samples, args.embeddings)
+        print(f"Wrote {path}")
+    else:
+        report = parity_report(args.model, args.tflite, args.image_dir, args.limit, args.threads)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text)
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
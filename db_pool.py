@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import instrumentation
+
+# Default SQL Server connection string used by the app
+SQLSERVER_CONNECTION_STRING = (
+    'DRIVER={ODBC Driver 17 for SQL Server};'
+    'SERVER=HARIHARAN\\SQLEXPRESS;'  # Replace with your server name
+    'DATABASE=UserDB;'     # Replace with your database name
+    'Trusted_Connection=yes;'
+)
+
+
+# Interface of a database backend: opens new DB-API connections that use '?' placeholders.
+# `dialect` names the SQL flavour for the few statements that differ between backends.
+class Backend:
+    dialect = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    # Function to get the driver's exception for a violated constraint (e.g. a duplicate key)
+    def integrity_error(self):
+        raise NotImplementedError
+
+    # Function to check that a pooled connection is still usable
+    def ping(self, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+class SqlServerBackend(Backend):
+    dialect = 'sqlserver'
+
+    def __init__(self, connection_string=SQLSERVER_CONNECTION_STRING):
+        self.connection_string = connection_string
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def integrity_error(self):
+        import pyodbc
+        return pyodbc.IntegrityError
+
+
+# Local stand-in for SQL Server, for tests and single-node deployments
+class SQLiteBackend(Backend):
+    dialect = 'sqlite'
+
+    def __init__(self, path='users.db'):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS Users (Username TEXT PRIMARY KEY, Password TEXT NOT NULL)")
+        conn.commit()
+        return conn
+
+    def integrity_error(self):
+        return sqlite3.IntegrityError
+
+
+# Thread-safe pool of reusable connections with health checks and idle eviction
+class ConnectionPool:
+    def __init__(self, backend, size=5, idle_timeout=300, check_interval=30, acquire_timeout=10):
+        self.backend = backend
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle = deque()  # (connection, time it was returned to the pool)
+        self._open = 0
+        self._cond = threading.Condition()
+
+    # Function to close connections that have been idle for longer than idle_timeout
+    def _evict_idle(self, now):
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._open -= 1
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # Function to take a connection from the pool, opening a new one if the pool is not full
+    def acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._evict_idle(now)
+                if self._idle:
+                    conn, returned = self._idle.pop()  # most recently used first
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    conn, returned = None, now
+                    break
+                if not self._cond.wait(deadline - now) and time.monotonic() >= deadline:
+                    raise TimeoutError("Timed out waiting for a database connection")
+
+        try:
+            if conn is None:
+                conn = self.backend.connect()
+            elif time.monotonic() - returned > self.check_interval:
+                self.backend.ping(conn)
+            return conn
+        except Exception:
+            # Broken connection (or failed connect): drop it and open a fresh one
+            if conn is not None:
+                self._close(conn)
+            try:
+                return self.backend.connect()
+            except Exception:
+                self._discard()
+                raise
+
+    # Function to give a connection back to the pool
+    def release(self, conn):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # Function to forget a connection that is broken or closed
+    def _discard(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        with instrumentation.span('db.acquire'):
+            conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                # The connection is unusable: drop it, but raise the error of the caller, not the rollback's
+                self._close(conn)
+                self._discard()
+            else:
+                self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    # Function to close every idle connection
+    def close(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._open -= 1
+                self._close(conn)
+
+
+# Function to build the pool configured by environment variables
+#   DB_BACKEND=sqlserver (default) or sqlite, DB_SQLITE_PATH, DB_CONNECTION_STRING,
+#   DB_POOL_SIZE, DB_POOL_IDLE_TIMEOUT (seconds)
+def create_pool_from_env():
+    if os.environ.get('DB_BACKEND', 'sqlserver') == 'sqlite':
+        backend = SQLiteBackend(os.environ.get('DB_SQLITE_PATH', 'users.db'))
+    else:
+        backend = SqlServerBackend(os.environ.get('DB_CONNECTION_STRING', SQLSERVER_CONNECTION_STRING))
+    return ConnectionPool(
+        backend,
+        size=int(os.environ.get('DB_POOL_SIZE', '5')),
+        idle_timeout=float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300')),
+    )
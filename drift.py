@@ -0,0 +1,253 @@
+import argparse
+import os
+import threading
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+import instrumentation
+import validation
+
+# Input-drift monitoring of the tabular models against the training CSVs.
+#   DRIFT_MONITOR          - 1 or 0 to turn monitoring on or off; by default it is on when the reference file exists
+#   DRIFT_REFERENCE_PATH   - reference bins written by `python drift.py build` (with DRIFT_MONITOR=1 and no file,
+#                            built from the CSVs in the background, which loads pandas)
+#   DRIFT_INTERVAL         - seconds between score updates (default 60)
+#   DRIFT_HALF_LIFE        - seconds after which an observed input counts half as much (default 3600)
+#   DRIFT_MIN_SAMPLES      - inputs needed before a disease is scored (default 200)
+REFERENCE_PATH = os.environ.get('DRIFT_REFERENCE_PATH', 'drift_reference.npz')
+ENABLED = os.environ.get('DRIFT_MONITOR', '1' if os.path.exists(REFERENCE_PATH) else '0') not in ('', '0', 'false', 'False')
+
+# Usual PSI reading: below 0.1 stable, 0.1-0.25 moderate shift, above 0.25 major shift
+PSI_MODERATE = 0.1
+PSI_MAJOR = 0.25
+# A feature is only flagged when its counts also differ from the training shares by more than chance, in a
+# chi-square test at this false-alarm rate per disease (split over its features). The PSI of a window of a
+# few hundred inputs is well above 0 even when they are drawn from the training data itself.
+ALERT_ALPHA = 0.001
+
+_EPSILON = 1e-4  # floor for empty bins, so PSI stays finite
+
+
+# Function to build the reference of one disease from its training rows. Only rows the forms accept as a
+# whole are used (the CSVs contain e.g. 0 for a missing insulin reading), the same population observe()
+# gets, since features are correlated and rejecting a row changes the other features too. Returns {'edges': (fields, bins - 1) cut points at the
+# training quantiles, 'proportions': (fields, bins) training share per bin}; features with fewer
+# distinct cut points (e.g. categorical ones) are padded with +inf, giving empty bins.
+def _reference_entry(disease, X, bins):
+    X = X[~validation.validate(disease, X).any(axis=1)]
+    quantiles = np.linspace(0, 1, bins + 1)[1:-1]
+    edges = np.full((X.shape[1], bins - 1), np.inf)
+    proportions = np.zeros((X.shape[1], bins))
+    for j in range(X.shape[1]):
+        values = X[:, j]
+        cuts = np.unique(np.quantile(values, quantiles))
+        edges[j, :len(cuts)] = cuts
+        proportions[j] = np.bincount(np.searchsorted(edges[j], values, side='left'), minlength=bins) / len(values)
+    return {'edges': edges, 'proportions': proportions}
+
+
+# Function to count a (rows, fields) array into the bins of each feature; returns a (fields, bins) array
+def bin_counts(edges, X):
+    fields, n_bins = edges.shape[0], edges.shape[1] + 1
+    index = np.empty(X.shape, dtype=np.int64)
+    for j in range(fields):
+        index[:, j] = np.searchsorted(edges[j], X[:, j], side='left') + j * n_bins
+    return np.bincount(index.ravel(), minlength=fields * n_bins).reshape(fields, n_bins).astype(np.float64)
+
+
+# Function to build the reference of every tabular disease from its training CSV
+def build_reference(bins=10):
+    import train
+    return {
+        disease: _reference_entry(disease, train.load_dataset(disease)[0].to_numpy(dtype=np.float64), bins)
+        for disease in train.DATASETS
+    }
+
+
+def save_reference(reference, path=REFERENCE_PATH):
+    arrays = {f'{disease}__{name}': value for disease, entry in reference.items() for name, value in entry.items()}
+    np.savez(path, **arrays)
+
+
+def load_reference(path=REFERENCE_PATH):
+    reference = {}
+    with np.load(path) as data:
+        for name in data.files:
+            disease, key = name.split('__')
+            reference.setdefault(disease, {})[key] = data[name]
+    return reference
+
+
+# Function to compare binned live counts with the training proportions of each feature.
+# Returns (PSI, KS) arrays; KS is the largest gap between the two CDFs at the bin edges.
+def drift_scores(proportions, counts):
+    live = counts / max(counts[0].sum(), 1e-12)
+    p = np.maximum(live, _EPSILON)
+    q = np.maximum(proportions, _EPSILON)
+    psi = ((p - q) * np.log(p / q)).sum(axis=1)
+    ks = np.abs(np.cumsum(live, axis=1) - np.cumsum(proportions, axis=1)).max(axis=1)
+    return psi, ks
+
+
+# Function to get the chi-square statistic of binned live counts against the training proportions and the
+# number of degrees of freedom, per feature. Bins without training rows are left out unless inputs fall there.
+def chi_square(proportions, counts):
+    n = counts[0].sum()
+    expected = n * np.maximum(proportions, _EPSILON)
+    used = (proportions > 0) | (counts > 0)
+    statistic = np.where(used, (counts - expected) ** 2 / expected, 0).sum(axis=1)
+    return statistic, np.maximum(used.sum(axis=1) - 1, 1)
+
+
+# Function to get the chi-square value exceeded with probability alpha (Wilson-Hilferty approximation)
+def chi_square_critical(df, alpha):
+    z = NormalDist().inv_cdf(1 - alpha)
+    return df * (1 - 2 / (9 * df) + z * np.sqrt(2 / (9 * df))) ** 3
+
+
+def _status(psi, significant=True):
+    if not significant:
+        return 'stable'
+    if psi >= PSI_MAJOR:
+        return 'major'
+    if psi >= PSI_MODERATE:
+        return 'moderate'
+    return 'stable'
+
+
+_SEVERITY = ('collecting', 'stable', 'moderate', 'major')
+
+
+# Function to score the (fields, bins) counts of one disease against its reference entry; returns
+# {'samples', 'status', 'max_psi', 'features': [{'feature', 'psi', 'ks', 'chi2', 'significant', 'status'}]}.
+# The disease status is the worst of its features; 'collecting' below min_samples inputs.
+def score_counts(disease, entry, counts, min_samples=200, alpha=ALERT_ALPHA):
+    samples = float(counts[0].sum())
+    scores = {'samples': samples, 'updated_at': time.time(), 'features': [], 'status': 'collecting'}
+    if samples < min_samples:
+        return scores
+    psi, ks = drift_scores(entry['proportions'], counts)
+    statistic, df = chi_square(entry['proportions'], counts)
+    significant = statistic > chi_square_critical(df, alpha / len(psi))
+    for field, p, k, c, sig in zip(validation.SCHEMAS[disease], psi, ks, statistic, significant):
+        scores['features'].append({'feature': field.column, 'psi': float(p), 'ks': float(k), 'chi2': float(c),
+                                   'significant': bool(sig), 'status': _status(p, sig)})
+    scores['max_psi'] = float(psi.max())
+    scores['status'] = max((f['status'] for f in scores['features']), key=_SEVERITY.index)
+    return scores
+
+
+# Tracks the inputs of each tabular disease in fixed-size, exponentially decaying bin counts (a few hundred
+# floats per disease, however many inputs are seen), so observe() is one searchsorted per feature and a lock.
+# A background thread scores the counts against the training reference every `interval` seconds,
+# publishes them as drift_psi/drift_ks gauges and then decays the counts by the half-life.
+class DriftMonitor:
+    def __init__(self, reference=None, interval=60.0, half_life=3600.0, min_samples=200, reference_path=REFERENCE_PATH):
+        self.interval = interval
+        self.half_life = half_life
+        self.min_samples = min_samples
+        self.reference_path = reference_path
+        self._lock = threading.Lock()
+        self._reference = None
+        self._counts = {}
+        self._scores = {}
+        self._stop = threading.Event()
+        if reference is not None:
+            self._set_reference(reference)
+        self._thread = threading.Thread(target=self._run, name='drift-monitor', daemon=True)
+        self._thread.start()
+
+    def _set_reference(self, reference):
+        with self._lock:
+            self._counts = {disease: np.zeros_like(entry['proportions']) for disease, entry in reference.items()}
+            self._reference = reference
+
+    # Function to add a (rows, fields) array of valid inputs; dropped until the reference is loaded
+    def observe(self, disease, X):
+        reference = self._reference
+        if reference is None or disease not in reference or not len(X):
+            return
+        counts = bin_counts(reference[disease]['edges'], np.atleast_2d(X))
+        with self._lock:
+            self._counts[disease] += counts
+
+    def _run(self):
+        if self._reference is None:
+            try:
+                if os.path.exists(self.reference_path):
+                    self._set_reference(load_reference(self.reference_path))
+                else:
+                    self._set_reference(build_reference())
+            except Exception:
+                instrumentation.count('drift.reference_failed')
+                return
+        while not self._stop.wait(self.interval):
+            self.update()
+
+    # Function to score the current counts of every disease and then decay them; returns the scores
+    def update(self):
+        decay = 0.5 ** (self.interval / self.half_life)
+        with self._lock:
+            snapshot = {disease: counts.copy() for disease, counts in self._counts.items()}
+            for counts in self._counts.values():
+                counts *= decay
+        scores = {}
+        for disease, counts in snapshot.items():
+            entry = score_counts(disease, self._reference[disease], counts, self.min_samples)
+            for feature in entry['features']:
+                instrumentation.gauge('drift_psi', feature['psi'], disease=disease, feature=feature['feature'])
+                instrumentation.gauge('drift_ks', feature['ks'], disease=disease, feature=feature['feature'])
+            instrumentation.gauge('drift_samples', entry['samples'], disease=disease)
+            scores[disease] = entry
+        self._scores = scores
+        return scores
+
+    # Function to get the latest scores: {disease: score_counts(...)}
+    def scores(self):
+        return self._scores
+
+    def close(self):
+        self._stop.set()
+
+
+# Function to build the monitor configured by environment variables (see the top of this module)
+def create_monitor_from_env():
+    return DriftMonitor(
+        interval=float(os.environ.get('DRIFT_INTERVAL', '60')),
+        half_life=float(os.environ.get('DRIFT_HALF_LIFE', '3600')),
+        min_samples=float(os.environ.get('DRIFT_MIN_SAMPLES', '200')),
+        reference_path=REFERENCE_PATH,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Input-drift reference and offline checks for the tabular models.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Compute the reference bins from the training CSVs')
+    build.add_argument('--bins', type=int, default=10, help='Quantile bins per feature')
+    build.add_argument('--output', default=REFERENCE_PATH)
+    check = commands.add_parser('check', help='Score a CSV of inputs against the reference')
+    check.add_argument('disease', choices=list(validation.SCHEMAS))
+    check.add_argument('csv', help='CSV with the training column names')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        save_reference(build_reference(args.bins), args.output)
+        print(f"Reference for {args.bins} bins per feature -> {args.output}")
+        return
+    import pandas as pd
+    reference = load_reference() if os.path.exists(REFERENCE_PATH) else build_reference()
+    X = pd.read_csv(args.csv, encoding='utf-8-sig')[validation.columns(args.disease)].to_numpy(dtype=np.float64)
+    X = X[~validation.validate(args.disease, X).any(axis=1)]
+    entry = reference[args.disease]
+    scores = score_counts(args.disease, entry, bin_counts(entry['edges'], X), min_samples=0)
+    print(f"{args.disease}: {len(X)} valid rows, {scores['status']}")
+    for feature in sorted(scores['features'], key=lambda f: -f['psi']):
+        print(f"  {feature['feature']:<28} PSI {feature['psi']:7.3f}  KS {feature['ks']:5.3f}  "
+              f"chi2 {feature['chi2']:8.1f}  {feature['status']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+import instrumentation
+
+# Statements that create the history table and its indexes, per database dialect (see db_pool.Backend.dialect).
+# RecordId is a random id given to each record by record(); its unique index makes writing a record twice
+# (e.g. when a replay from the fallback file is retried) store it once.
+SCHEMA_SQL = {
+    'sqlserver': [
+        "IF OBJECT_ID('PredictionHistory', 'U') IS NULL CREATE TABLE PredictionHistory ("
+        "Id BIGINT IDENTITY(1,1) PRIMARY KEY, Username NVARCHAR(150) NOT NULL, Disease NVARCHAR(32) NOT NULL, "
+        "Features NVARCHAR(MAX) NOT NULL, ModelVersion NVARCHAR(255) NULL, Result NVARCHAR(64) NOT NULL, "
+        "LatencyMs FLOAT NULL, CreatedAt DATETIME2 NOT NULL, RecordId CHAR(32) NULL)",
+        "IF COL_LENGTH('PredictionHistory', 'RecordId') IS NULL ALTER TABLE PredictionHistory ADD RecordId CHAR(32) NULL",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_PredictionHistory_User') "
+        "CREATE INDEX IX_PredictionHistory_User ON PredictionHistory (Username, Id DESC)",
+        "IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'UX_PredictionHistory_Record') "
+        "CREATE UNIQUE INDEX UX_PredictionHistory_Record ON PredictionHistory (RecordId) WHERE RecordId IS NOT NULL",
+    ],
+    'sqlite': [
+        "CREATE TABLE IF NOT EXISTS PredictionHistory ("
+        "Id INTEGER PRIMARY KEY AUTOINCREMENT, Username TEXT NOT NULL, Disease TEXT NOT NULL, "
+        "Features TEXT NOT NULL, ModelVersion TEXT, Result TEXT NOT NULL, LatencyMs REAL, CreatedAt TEXT NOT NULL, "
+        "RecordId TEXT)",
+        "CREATE INDEX IF NOT EXISTS IX_PredictionHistory_User ON PredictionHistory (Username, Id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS UX_PredictionHistory_Record ON PredictionHistory (RecordId)",
+    ],
+}
+# Columns added to PredictionHistory after its first version; SQLite has no ADD COLUMN IF NOT EXISTS
+SQLITE_ADDED_COLUMNS = (('RecordId', 'TEXT'),)
+# Extra columns of the fallback file: which recorder has claimed a row for replay, and when
+FALLBACK_COLUMNS = (('ClaimedBy', 'TEXT'), ('ClaimedAt', 'REAL'))
+# Seconds after which rows claimed by another recorder (e.g. one that died mid-replay) may be claimed again
+CLAIM_TIMEOUT = 300
+
+COLUMNS = ('Username', 'Disease', 'Features', 'ModelVersion', 'Result', 'LatencyMs', 'CreatedAt', 'RecordId')
+# Inserts that skip records already stored with the same RecordId. The SQL Server one takes the RecordId
+# a second time as its last parameter (see _insert_params).
+INSERT_SQL = {
+    'sqlserver': f"INSERT INTO PredictionHistory ({', '.join(COLUMNS)}) SELECT {', '.join('?' * len(COLUMNS))} "
+                 "WHERE NOT EXISTS (SELECT 1 FROM PredictionHistory WHERE RecordId = ?)",
+    'sqlite': f"INSERT OR IGNORE INTO PredictionHistory ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+}
+
+# Newest-first page of one user's history before a given Id (keyset pagination on the per-user index)
+_PAGE_COLUMNS = "Id, CreatedAt, Disease, Result, ModelVersion, LatencyMs, Features"
+PAGE_SQL = {
+    'sqlserver': f"SELECT TOP (?) {_PAGE_COLUMNS} FROM PredictionHistory WHERE Username = ? AND Id < ? ORDER BY Id DESC",
+    'sqlite': f"SELECT {_PAGE_COLUMNS} FROM PredictionHistory WHERE Username = ? AND Id < ? ORDER BY Id DESC LIMIT ?",
+}
+
+
+# Function to create the history table and indexes if they do not exist, adding columns that older tables lack
+def _create_schema(cursor, dialect, extra_columns=()):
+    create_table, *statements = SCHEMA_SQL[dialect]
+    cursor.execute(create_table)
+    if dialect == 'sqlite':
+        existing = {row[1] for row in cursor.execute("PRAGMA table_info(PredictionHistory)").fetchall()}
+        for column, sql_type in SQLITE_ADDED_COLUMNS + tuple(extra_columns):
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE PredictionHistory ADD COLUMN {column} {sql_type}")
+    for statement in statements:
+        cursor.execute(statement)
+
+
+def ensure_schema(pool):
+    with pool.connection() as conn:
+        _create_schema(conn.cursor(), pool.backend.dialect)
+        conn.commit()
+
+
+def _insert_params(dialect, rows):
+    return [row + (row[-1],) for row in rows] if dialect == 'sqlserver' else rows
+
+
+# Function to get one page of a user's predictions, newest first. Pass the Id of the last row of a page
+# as before_id to get the next one; returns a list of dicts.
+def fetch_history(pool, username, limit=20, before_id=None):
+    before_id = before_id if before_id is not None else 2 ** 62
+    dialect = pool.backend.dialect
+    params = (limit, username, before_id) if dialect == 'sqlserver' else (username, before_id, limit)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(PAGE_SQL[dialect], params)
+        rows = cursor.fetchall()
+    return [
+        {'id': row[0], 'created_at': str(row[1]), 'disease': row[2], 'result': row[3],
+         'model_version': row[4], 'latency_ms': row[5], 'features': json.loads(row[6])}
+        for row in rows
+    ]
+
+
+# Records predictions without touching the database on the request path. record() appends to a bounded
+# in-memory ring buffer; a background thread writes the buffer in executemany batches whenever batch_size
+# records are waiting or flush_interval seconds have passed. If the database cannot be written, batches go
+# to a local SQLite file (fallback_path). Every cycle in which the database accepts writes also replays up to
+# batch_size of those records. Processes may share the fallback file: each one claims the rows it replays, and a
+# record that still gets written twice (a replay interrupted between the insert and the delete) is stored once.
+# When the buffer is full, record() waits up to max_block seconds for the writer, then drops the oldest record.
+class HistoryRecorder:
+    def __init__(self, pool, capacity=10000, batch_size=500, flush_interval=2.0, max_block=0.0,
+                 fallback_path='history_fallback.db'):
+        self.pool = pool
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_block = max_block
+        self.fallback_path = fallback_path
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._closing = False
+        self._schema_ready = False
+        self._fallback = None
+        self._claim_token = uuid.uuid4().hex  # marks the fallback rows this recorder is replaying
+        self._stats = {'max_buffered': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'fallback': 0, 'replayed': 0}
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Function to queue one prediction; `features` must be JSON-serialisable (e.g. a list of floats)
+    def record(self, username, disease, features, model_version, result, latency_ms):
+        row = (username, disease, json.dumps(features), model_version, str(result), float(latency_ms),
+               time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), uuid.uuid4().hex)
+        with self._cond:
+            if len(self._buffer) >= self.capacity and self.max_block > 0:
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: len(self._buffer) < self.capacity, self.max_block)
+            if len(self._buffer) >= self.capacity:
+                self._buffer.popleft()
+                self._stats['dropped'] += 1
+                instrumentation.count('history.dropped')
+            self._buffer.append(row)
+            self._stats['max_buffered'] = max(self._stats['max_buffered'], len(self._buffer))
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closing and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                closing = self._closing
+                self._cond.notify_all()  # wake producers waiting for space
+            if closing and not batch:
+                if self._fallback is not None:
+                    self._fallback.close()  # sqlite3 connections belong to the thread that opened them
+                    self._fallback = None
+                return
+            # Replay on busy cycles too, so the fallback drains under steady traffic
+            if (not batch or self._write(batch)) and not closing:
+                self._replay()
+
+    # Function to write a batch to the database, or to the fallback file if that fails; returns True if written
+    def _write(self, batch):
+        try:
+            with instrumentation.span('history.write'):
+                self._insert(batch)
+        except Exception:
+            self._write_fallback(batch)
+            return False
+        self._stats['written'] += len(batch)
+        self._stats['batches'] += 1
+        instrumentation.count('history.written', len(batch))
+        return True
+
+    # Function to insert a batch into the database with one executemany round-trip
+    def _insert(self, rows):
+        if not self._schema_ready:
+            ensure_schema(self.pool)
+            self._schema_ready = True
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            if hasattr(cursor, 'fast_executemany'):
+                cursor.fast_executemany = True  # pyodbc: send the whole batch as one parameter array
+            dialect = self.pool.backend.dialect
+            cursor.executemany(INSERT_SQL[dialect], _insert_params(dialect, rows))
+            conn.commit()
+
+    def _fallback_connection(self):
+        if self._fallback is None:
+            conn = sqlite3.connect(self.fallback_path)
+            _create_schema(conn.cursor(), 'sqlite', FALLBACK_COLUMNS)
+            # Rows written before records had ids
+            conn.execute("UPDATE PredictionHistory SET RecordId = lower(hex(randomblob(16))) WHERE RecordId IS NULL")
+            conn.commit()
+            self._fallback = conn
+        return self._fallback
+
+    def _write_fallback(self, batch):
+        try:
+            conn = self._fallback_connection()
+            conn.executemany(INSERT_SQL['sqlite'], batch)
+            conn.commit()
+            self._stats['fallback'] += len(batch)
+            instrumentation.count('history.fallback', len(batch))
+        except Exception:
+            self._stats['dropped'] += len(batch)
+            instrumentation.count('history.dropped', len(batch))
+
+    # Function to move one batch of fallback records into the database, when there are any. The rows are first
+    # claimed with one UPDATE, so other processes sharing the file replay other rows; rows this recorder
+    # claimed before but could not move are retried first.
+    def _replay(self):
+        if self._fallback is None and not os.path.exists(self.fallback_path):
+            return
+        try:
+            conn = self._fallback_connection()
+            now = time.time()
+            conn.execute(
+                "UPDATE PredictionHistory SET ClaimedBy = ?, ClaimedAt = ? WHERE Id IN (SELECT Id FROM PredictionHistory "
+                "WHERE ClaimedBy IS NULL OR ClaimedBy = ? OR ClaimedAt < ? ORDER BY Id LIMIT ?)",
+                (self._claim_token, now, self._claim_token, now - CLAIM_TIMEOUT, self.batch_size))
+            conn.commit()
+            rows = conn.execute(f"SELECT Id, {', '.join(COLUMNS)} FROM PredictionHistory WHERE ClaimedBy = ? ORDER BY Id "
+                                "LIMIT ?", (self._claim_token, self.batch_size)).fetchall()
+            if not rows:
+                return
+            self._insert([row[1:] for row in rows])
+            conn.executemany("DELETE FROM PredictionHistory WHERE Id = ?", [(row[0],) for row in rows])
+            conn.commit()
+            self._stats['replayed'] += len(rows)
+            instrumentation.count('history.replayed', len(rows))
+        except Exception:
+            pass  # the database is still unavailable; try again on the next cycle
+
+    # Function to get the buffer and writer counters
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, buffered=len(self._buffer))
+
+    # Function to write everything still buffered and stop the writer thread
+    def close(self, timeout=10):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+# Function to build the recorder configured by environment variables
+#   HISTORY_BUFFER_SIZE, HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL (seconds),
+#   HISTORY_MAX_BLOCK_MS (how long record() may wait when the buffer is full), HISTORY_FALLBACK_PATH
+def create_recorder_from_env(pool):
+    return HistoryRecorder(
+        pool,
+        capacity=int(os.environ.get('HISTORY_BUFFER_SIZE', '10000')),
+        batch_size=int(os.environ.get('HISTORY_BATCH_SIZE', '500')),
+        flush_interval=float(os.environ.get('HISTORY_FLUSH_INTERVAL', '2')),
+        max_block=float(os.environ.get('HISTORY_MAX_BLOCK_MS', '0')) / 1000,
+        fallback_path=os.environ.get('HISTORY_FALLBACK_PATH', 'history_fallback.db'),
+    )
+
+
+if __name__ == '__main__':
+    import db_pool
+    ensure_schema(db_pool.create_pool_from_env())
+    print("PredictionHistory table and index are in place")
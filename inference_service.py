@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from aiohttp import web
+
+import covid_model
+import drift
+import instrumentation
+import predictors
+import validation
+
+TABULAR_DISEASES = sorted(validation.SCHEMAS)
+
+
+# Runs blocking model calls on a fixed pool of threads and caps how many calls may wait for it,
+# so the event loop never blocks and overload turns into HTTP 503 instead of an unbounded queue
+class BoundedExecutor:
+    def __init__(self, workers=4, max_pending=64):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self._slots = asyncio.BoundedSemaphore(max_pending)
+
+    async def run(self, fn, *args):
+        if self._slots.locked():
+            raise web.HTTPServiceUnavailable(text='Too many pending requests')
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _tabular_result(disease, prediction, values, invalid):
+    if invalid.any():
+        return {'prediction': None, 'errors': validation.row_errors(disease, values, invalid)}
+    return {'prediction': int(prediction), 'errors': []}
+
+
+def _image_result(probs):
+    return {
+        'label': covid_model.CLASS_NAMES[int(np.argmax(probs))],
+        'probabilities': {name: float(p) for name, p in zip(covid_model.CLASS_NAMES, probs)},
+    }
+
+
+def _disease(request):
+    disease = request.match_info['disease']
+    if disease not in validation.SCHEMAS:
+        raise web.HTTPNotFound(text=f"Unknown disease '{disease}'. Use one of: {', '.join(TABULAR_DISEASES)}")
+    return disease
+
+
+# Function to read a request body that must be a JSON object
+async def _json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='Request body must be JSON')
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='Request body must be a JSON object')
+    return body
+
+
+def _parse_records(disease, records):
+    if not records:
+        return np.empty((0, len(validation.SCHEMAS[disease])))
+    try:
+        return np.array([predictors.parse_record(disease, record) for record in records]).reshape(len(records), -1)
+    except (TypeError, ValueError) as e:
+        raise web.HTTPBadRequest(text=str(e))
+
+
+# POST /predict/{disease}  {"features": {...} or [...]}
+async def predict_one(request):
+    disease = _disease(request)
+    body = await _json(request)
+    with instrumentation.span('parse'):
+        X = _parse_records(disease, [body.get('features')])
+    predictions, invalid = await request.app['executor'].run(predictors.predict_tabular, disease, X)
+    return web.json_response(_tabular_result(disease, predictions[0], X[0], invalid[0]))
+
+
+# POST /predict/{disease}/batch  {"instances": [{...} or [...], ...]}
+async def predict_batch(request):
+    disease = _disease(request)
+    body = await _json(request)
+    records = body.get('instances')
+    if not isinstance(records, list):
+        raise web.HTTPBadRequest(text="'instances' must be a list")
+    with instrumentation.span('parse'):
+        X = _parse_records(disease, records)
+    predictions, invalid = await request.app['executor'].run(predictors.predict_tabular, disease, X)
+    results = [_tabular_result(disease, p, x, m) for p, x, m in zip(predictions, X, invalid)]
+    return web.json_response({'predictions': results})
+
+
+# POST /risk/{disease}  {"instances": [{...} or [...], ...]}
+# Calibrated risk for every instance, plus the indices of the valid ones ordered from highest to lowest risk
+async def predict_risk(request):
+    disease = _disease(request)
+    body = await _json(request)
+    records = body.get('instances')
+    if not isinstance(records, list):
+        raise web.HTTPBadRequest(text="'instances' must be a list")
+    with instrumentation.span('parse'):
+        X = _parse_records(disease, records)
+    try:
+        risks, flags, invalid = await request.app['executor'].run(predictors.predict_risk, disease, X)
+    except LookupError as e:
+        raise web.HTTPNotFound(text=str(e))
+    results = [
+        {'risk': None, 'flag': None, 'errors': validation.row_errors(disease, x, m)} if m.any()
+        else {'risk': float(r), 'flag': int(f), 'errors': []}
+        for r, f, x, m in zip(risks, flags, X, invalid)
+    ]
+    valid = np.flatnonzero(~np.isnan(risks))
+    ranking = valid[np.argsort(-risks[valid], kind='stable')]
+    return web.json_response({
+        'threshold': predictors.risk_threshold(disease),
+        'predictions': results,
+        'ranking': ranking.tolist(),
+    })
+
+
+# Function to read the uploaded images of a request: multipart files, or the raw body for a single image
+async def _read_images(request):
+    if request.content_type.startswith('multipart/'):
+        datas = []
+        reader = await request.multipart()
+        async for part in reader:
+            if part.filename:
+                datas.append(await part.read())
+        return datas
+    return [await request.read()]
+
+
+def _similar_result(case):
+    return {
+        'id': case['id'],
+        'similarity': case['similarity'],
+        'source': os.path.basename(case['source']),
+        'label': case['label'] or None,
+        'predicted': case['predicted'],
+    }
+
+
+# POST /predict/covid (one image) and /predict/covid/batch (several multipart files).
+# With ?similar=k each result also lists the k most similar cases of the similar-case index (see similar_cases.py).
+async def predict_covid(request):
+    try:
+        k = int(request.query.get('similar', '0'))
+    except ValueError:
+        raise web.HTTPBadRequest(text="'similar' must be an integer")
+    if k > 0 and predictors.get_similar_case_index() is None:
+        raise web.HTTPNotFound(text='No similar-case index; build one with `python similar_cases.py add <dir>`')
+    datas = await _read_images(request)
+    if not datas or not all(datas):
+        raise web.HTTPBadRequest(text='No image uploaded')
+    try:
+        probabilities, embeddings = await request.app['executor'].run(predictors.classify_images, datas)
+    except OSError as e:
+        raise web.HTTPBadRequest(text=f'Could not decode image: {e}')
+    results = [_image_result(probs) for probs in probabilities]
+    if k > 0:
+        similar = await request.app['executor'].run(predictors.find_similar, embeddings, k)
+        if similar is None:
+            raise web.HTTPNotFound(text='The COVID_BACKEND model has no embeddings output')
+        for result, cases in zip(results, similar):
+            result['similar'] = [_similar_result(case) for case in cases]
+    if request.path.endswith('/batch'):
+        return web.json_response({'predictions': results})
+    return web.json_response(results[0])
+
+
+# Middleware timing every request by route, with optional per-request cProfile dumps
+@web.middleware
+async def instrument(request, handler):
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    with instrumentation.profile_request('http'), instrumentation.span(f'http {request.method} {route}'):
+        return await handler(request)
+
+
+async def metrics(request):
+    return web.Response(text=instrumentation.prometheus_text(), content_type='text/plain')
+
+
+async def health(request):
+    return web.json_response({'status': 'ok', **predictors.get_stats()})
+
+
+# GET /drift - latest input-drift scores of this process against the training data (see drift.py)
+async def drift_scores(request):
+    if not drift.ENABLED:
+        raise web.HTTPNotFound(text='Drift monitoring is off (build the reference with `python drift.py build`, or set DRIFT_MONITOR=1)')
+    return web.json_response(predictors.get_drift_monitor().scores())
+
+
+def create_app(workers=4, max_pending=64):
+    app = web.Application(client_max_size=64 * 1024 * 1024, middlewares=[instrument])
+
+    async def on_startup(app):
+        app['executor'] = BoundedExecutor(workers, max_pending)
+
+    async def on_cleanup(app):
+        app['executor'].shutdown()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/drift', drift_scores)
+    # The COVID routes are registered first so they take precedence over /predict/{disease}
+    app.router.add_post('/predict/covid', predict_covid)
+    app.router.add_post('/predict/covid/batch', predict_covid)
+    app.router.add_post('/predict/{disease}', predict_one)
+    app.router.add_post('/predict/{disease}/batch', predict_batch)
+    app.router.add_post('/risk/{disease}', predict_risk)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='REST/JSON inference service for the disease prediction models.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('INFERENCE_WORKERS', '4')),
+                        help='Threads running model calls')
+    parser.add_argument('--max-pending', type=int, default=int(os.environ.get('INFERENCE_MAX_PENDING', '64')),
+                        help='Model calls allowed to wait before requests are rejected with 503')
+    args = parser.parse_args(argv)
+    web.run_app(create_app(args.workers, args.max_pending), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import cProfile
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+# Timing and counters for the request hot path, exported in Prometheus text format.
+#   APP_TRACING=1         - record spans and counters (off by default; spans are then a shared no-op)
+#   APP_PROFILE_DIR=path  - also dump one cProfile .prof file per request into this directory
+#   APP_METRICS_PORT=9100 - serve /metrics over HTTP from the Streamlit process (see start_metrics_server)
+ENABLED = os.environ.get('APP_TRACING', '') not in ('', '0', 'false', 'False')
+PROFILE_DIR = os.environ.get('APP_PROFILE_DIR') or None
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NOOP = nullcontext()
+_lock = threading.Lock()
+_profile_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}  # (name, sorted label items) -> value
+_histograms = {}  # stage -> [bucket counts..., +Inf count, sum]
+
+
+def _observe(stage, seconds):
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += seconds
+
+
+@contextmanager
+def _span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe(stage, time.perf_counter() - start)
+
+
+# Function to time a stage of the request lifecycle, e.g. `with span('predict.diabetes'):`
+def span(stage):
+    return _span(stage) if ENABLED else _NOOP
+
+
+# Decorator form of span() for whole functions
+def timed(stage):
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Function to increment a counter, e.g. count('cache.hit')
+def count(name, value=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] += value
+
+
+# Function to set a gauge to its latest value, e.g. gauge('drift_psi', 0.12, disease='heart', feature='chol')
+def gauge(name, value, **labels):
+    if ENABLED:
+        with _lock:
+            _gauges[name, tuple(sorted(labels.items()))] = float(value)
+
+
+# Function to profile one request with cProfile when APP_PROFILE_DIR is set. Only one request is
+# profiled at a time; concurrent requests run unprofiled rather than waiting.
+@contextmanager
+def profile_request(name):
+    if not PROFILE_DIR or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            filename = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.perf_counter_ns()}.prof"
+            profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    finally:
+        _profile_lock.release()
+
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(items):
+    return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in items) + '}' if items else ''
+
+
+# Function to render all spans, counters and gauges in the Prometheus text exposition format
+def prometheus_text():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {stage: list(h) for stage, h in _histograms.items()}
+        gauges = dict(_gauges)
+    lines = []
+    if histograms:
+        lines.append('# HELP app_stage_duration_seconds Time spent in each request stage.')
+        lines.append('# TYPE app_stage_duration_seconds histogram')
+        for stage, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, histogram):
+                cumulative += bucket
+                lines.append(f'app_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            cumulative += histogram[len(BUCKETS)]
+            lines.append(f'app_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+            lines.append(f'app_stage_duration_seconds_sum{{stage="{stage}"}} {histogram[-1]}')
+            lines.append(f'app_stage_duration_seconds_count{{stage="{stage}"}} {cumulative}')
+    for name, value in sorted(counters.items()):
+        metric = f'app_{_metric_name(name)}_total'
+        lines.append(f'# TYPE {metric} counter')
+        lines.append(f'{metric} {value:g}')
+    declared = set()
+    for (name, labels), value in sorted(gauges.items()):
+        metric = f'app_{_metric_name(name)}'
+        if metric not in declared:
+            declared.add(metric)
+            lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric}{_labels(labels)} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+# Function to clear all recorded spans, counters and gauges
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+# Function to serve /metrics from a background thread (for processes without their own HTTP server).
+# http.server is imported here so processes that never export metrics do not pay for it at startup.
+def start_metrics_server(port):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
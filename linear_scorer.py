@@ -0,0 +1,69 @@
+import pickle
+
+import numpy as np
+
+import model_registry
+
+
+# Pure-NumPy scorer for the linear SVC / LogisticRegression models; sklearn is not needed to use it
+class LinearModel:
+    def __init__(self, coef, intercept, classes):
+        self.coef = np.ascontiguousarray(coef, dtype=np.float64).ravel()
+        self.intercept = float(np.ravel(intercept)[0])
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = self.coef.shape[0]
+
+    # Signed distance to the separating hyperplane, same as sklearn's decision_function
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        return X @ self.coef + self.intercept
+
+    # Predict class labels for a single row (1-D) or a batch (2-D) with one matrix multiply
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(np.intp)]
+
+    # Function to save the parameters into a small .npz file
+    def save(self, path):
+        np.savez(path, coef=self.coef, intercept=np.array([self.intercept]), classes=self.classes_)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['coef'], data['intercept'], data['classes'])
+
+    # Build from a fitted linear estimator, or a Pipeline of a StandardScaler and a linear estimator;
+    # the scaler is folded into the coefficients so scoring stays a single dot product
+    @classmethod
+    def from_sklearn(cls, model):
+        scaler = None
+        if hasattr(model, 'steps'):
+            if len(model.steps) == 2:
+                scaler = model.steps[0][1]
+            elif len(model.steps) != 1:
+                raise ValueError("Only pipelines of an optional StandardScaler and a linear model are supported")
+            model = model.steps[-1][1]
+        coef = np.ravel(model.coef_).astype(np.float64)
+        intercept = float(np.ravel(model.intercept_)[0])
+        if scaler is not None:
+            mean = scaler.mean_ if scaler.with_mean else 0.0
+            scale = scaler.scale_ if scaler.with_std else 1.0
+            coef = coef / scale
+            intercept -= float(np.sum(coef * mean))
+        return cls(coef, intercept, model.classes_)
+
+
+# Function to export the coefficients of the .sav models into .npz files next to them
+def export_models(model_dir='.'):
+    paths = []
+    for disease in model_registry.MODELS:
+        with open(model_registry.model_path(disease, '.sav', model_dir), 'rb') as f:
+            model = pickle.load(f)
+        path = model_registry.model_path(disease, '.npz', model_dir)
+        LinearModel.from_sklearn(model).save(path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    for path in export_models():
+        print(f"Wrote {path}")
@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+# Collects images submitted concurrently by many sessions and runs them through the classifier
+# together: a batch is flushed when it reaches max_batch_size images or when the oldest image has
+# waited max_wait seconds. Same predict() interface as the classifier it wraps.
+class MicroBatcher:
+    def __init__(self, classifier, max_batch_size=16, max_wait=0.01):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = Counter()
+        self._thread = threading.Thread(target=self._run, name='covid-micro-batcher', daemon=True)
+        self._thread.start()
+
+    # Function to queue one preprocessed (224, 224, 3) image; returns a Future of its (probability vector,
+    # embedding or None) pair
+    def submit(self, image):
+        future = Future()
+        self._queue.put((image, future))
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            with self._lock:
+                self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    # Function to classify a sequence of preprocessed images; returns a (n, classes) probability array
+    def predict(self, images):
+        return self.predict_with_embeddings(images)[0]
+
+    # Function to classify images and get the embeddings of the same forward pass, when the wrapped
+    # classifier provides them; returns (probabilities, embeddings or None)
+    def predict_with_embeddings(self, images):
+        results = [future.result() for future in [self.submit(image) for image in images]]
+        if not results:
+            return np.empty((0, 0), np.float32), None
+        probabilities = np.stack([probs for probs, _ in results])
+        if results[0][1] is None:
+            return probabilities, None
+        return probabilities, np.stack([embedding for _, embedding in results])
+
+    # Function to wait for the next batch: blocks for the first image, then for at most max_wait more
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Skip images whose caller has cancelled the future
+            live = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            images = [image for image, _ in live]
+            futures = [future for _, future in live]
+            try:
+                if hasattr(self.classifier, 'predict_with_embeddings'):
+                    probabilities, embeddings = self.classifier.predict_with_embeddings(np.stack(images))
+                else:
+                    probabilities, embeddings = self.classifier.predict(np.stack(images)), None
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for i, future in enumerate(futures):
+                    future.set_result((probabilities[i], None if embeddings is None else embeddings[i]))
+            with self._lock:
+                self._batches += 1
+                self._images += len(images)
+                self._batch_sizes[len(images)] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue_depth': self._max_queue_depth,
+                'batches': self._batches,
+                'images': self._images,
+                'mean_batch_size': self._images / self._batches if self._batches else 0.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+            }
+
+    # Function to stop the worker thread once the queued images have been processed
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,96 @@
+import os
+import pickle
+import threading
+
+import instrumentation
+
+# Base file name (without extension) of each tabular model
+MODELS = {
+    'diabetes': 'diabetes_model',
+    'heart': 'heart_disease_model',
+    'parkinsons': 'parkinsons_model',
+}
+
+_models = {}
+_versions = {}
+_calibrators = {}
+_lock = threading.Lock()
+
+
+# Function to get the path of a model artifact for a disease
+def model_path(disease, ext, model_dir='.'):
+    return os.path.join(model_dir, MODELS[disease] + ext)
+
+
+# Function to pick the artifact to load: the exported NumPy scorer, then the memory-mappable joblib file, then the pickle
+def artifact_path(disease, model_dir='.'):
+    for ext in ('.npz', '.joblib'):
+        path = model_path(disease, ext, model_dir)
+        if os.path.exists(path):
+            return path
+    return model_path(disease, '.sav', model_dir)
+
+
+# Function to load a model from disk
+def _load(path):
+    if path.endswith('.npz'):
+        from linear_scorer import LinearModel
+        return LinearModel.load(path)
+    if path.endswith('.joblib'):
+        import joblib
+        # mmap_mode='r' maps the NumPy arrays read-only, so every worker process shares one physical copy
+        return joblib.load(path, mmap_mode='r')
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# Function to get a model, loading it on first use and caching it for the life of the process
+def get_model(disease, model_dir='.'):
+    key = (disease, model_dir)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                path = artifact_path(disease, model_dir)
+                with instrumentation.span(f'model_load.{disease}'):
+                    model = _load(path)
+                _versions[key] = f"{os.path.basename(path)}@{int(os.path.getmtime(path))}"
+                _models[key] = model
+    return model
+
+
+# Function to get the version (artifact name and modification time) of a loaded model
+def get_version(disease, model_dir='.'):
+    get_model(disease, model_dir)
+    return _versions[(disease, model_dir)]
+
+
+# Function to get the probability calibrator of a disease (see calibration.py), or None if it has not been fitted
+def get_calibrator(disease, model_dir='.'):
+    key = (disease, model_dir)
+    if key not in _calibrators:
+        with _lock:
+            if key not in _calibrators:
+                from calibration import Calibrator, calibration_path
+                path = calibration_path(disease, model_dir)
+                _calibrators[key] = Calibrator.load(path) if os.path.exists(path) else None
+    return _calibrators[key]
+
+
+# Function to convert the .sav pickles into uncompressed joblib files that can be memory-mapped
+def convert_models(model_dir='.'):
+    import joblib
+    paths = []
+    for disease in MODELS:
+        with open(model_path(disease, '.sav', model_dir), 'rb') as f:
+            model = pickle.load(f)
+        path = model_path(disease, '.joblib', model_dir)
+        joblib.dump(model, path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    for path in convert_models():
+        print(f"Wrote {path}")
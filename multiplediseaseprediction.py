@@ -1,122 +1,293 @@
+import hashlib
+import os
+import time
+
 import numpy as np
-import tensorflow as tf
 
 from PIL import Image
-import pickle
 import streamlit as st
 from streamlit_option_menu import option_menu
-import pyodbc
 
-# Database connection
-def get_db_connection():
-    conn = pyodbc.connect(
-         'DRIVER={ODBC Driver 17 for SQL Server};'
-        'SERVER=HARIHARAN\SQLEXPRESS;'  # Replace with your server name
-        'DATABASE=UserDB;'     # Replace with your database name
-         'Trusted_Connection=yes;'
-    )
-    return conn
+import auth
+import covid_model
+import db_pool
+import drift
+import history
+import instrumentation
+import model_registry
+import predictors
+import screening
+import validation
+
+# Database connection pool, shared across sessions (configured by DB_* environment variables, see db_pool.py)
+@st.cache_resource
+def get_db_pool():
+    return db_pool.create_pool_from_env()
+
+
+# Serve Prometheus metrics on APP_METRICS_PORT, once per process
+@st.cache_resource
+def start_metrics_server():
+    port = os.environ.get('APP_METRICS_PORT')
+    return instrumentation.start_metrics_server(int(port)) if port else None
 
 
+# Load the models named by APP_WARMUP ('all' or e.g. 'diabetes,heart') on a background thread, once per process.
+# Without it every model, and TensorFlow, is loaded only when its page is first used.
 @st.cache_resource
-def load_covid_model():
-    return tf.keras.models.load_model("covid.h5")  # Replace with your trained model path
-
-# Function to preprocess the uploaded image
-def preprocess_image(image):
-    img = image.resize((224, 224))  # Resize to match the input size of the model
-    img_array = np.array(img)  # Convert image to NumPy array
-    # Ensure the image has 3 channels (RGB)
-    if img_array.ndim == 2:  # Grayscale image
-        img_array = np.stack((img_array,) * 3, axis=-1)  # Convert grayscale to RGB by duplicating channels
-    elif img_array.shape[2] == 4:  # RGBA image
-        img_array = img_array[:, :, :3]  # Drop the alpha channel
-    img_array = img_array / 255.0  # Normalize pixel values to [0, 1]
-    img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
-    return img_array
-
-
-# Function to create a new user
+def start_warmup():
+    targets = os.environ.get('APP_WARMUP')
+    return predictors.start_warmup(targets) if targets else None
+
+
+# Prediction history recorder, shared across sessions (configured by HISTORY_* environment variables, see history.py)
+@st.cache_resource
+def get_history_recorder():
+    return history.create_recorder_from_env(get_db_pool())
+
+
+# Create the history table and index once per process before the history page first reads them
+@st.cache_resource
+def ensure_history_schema():
+    history.ensure_schema(get_db_pool())
+
+
+# Create the unique Users.Username index once per process before the first login or sign-up looks users up
+@st.cache_resource
+def ensure_username_index():
+    auth.ensure_username_index(get_db_pool())
+
+
+# Function to create a new user (the password is stored as a salted hash, see auth.py); False if the name is taken
+@instrumentation.timed('db.create_user')
 def create_user(username, password):
-    conn = get_db_connection()
-    cursor = conn.cursor ()
-    cursor.execute("INSERT INTO Users (Username, Password) VALUES (?, ?)", (username, password))
-    conn.commit()
-    conn.close()
+    ensure_username_index()
+    return auth.create_user(get_db_pool(), username, password)
 
 # Function to check user credentials
+@instrumentation.timed('db.check_user_credentials')
 def check_user_credentials(username, password):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Users WHERE Username = ? AND Password = ?", (username, password))
-    user = cursor.fetchone()
-    conn.close()
-    return user
-
-# Load models
-diabetes_model = pickle.load(open("diabetes_model.sav", 'rb'))
-heart_disease_model =  pickle.load(open("heart_disease_model.sav", 'rb'))
-parkinsons_model = pickle.load(open("parkinsons_model.sav", 'rb'))
+    ensure_username_index()
+    return auth.authenticate(get_db_pool(), username, password)
+
+# Scoring (models, prediction cache, COVID-19 backend) lives in predictors.py, shared with the REST service
+def predict_tabular(disease, values):
+    predictions, _ = predictors.predict_tabular(disease, values)
+    return predictions
+
+# Function to show the calibrated risk under a prediction, when a calibrator has been fitted (see calibration.py)
+def show_risk(disease, values):
+    try:
+        risks, _, _ = predictors.predict_risk(disease, values)
+    except LookupError:
+        return
+    st.caption(f"Estimated risk: {risks[0]:.0%} (operating threshold {predictors.risk_threshold(disease):.0%})")
+
+# Function to show the most similar previously classified X-rays of an upload, when a similar-case index
+# has been built (see similar_cases.py); SIMILAR_CASES_K sets how many
+def show_similar_cases(embeddings):
+    similar = predictors.find_similar(embeddings, int(os.environ.get('SIMILAR_CASES_K', '5')))
+    if not similar or not similar[0]:
+        return
+    st.subheader("Most Similar Previous Cases:")
+    for column, case in zip(st.columns(len(similar[0])), similar[0]):
+        with column:
+            caption = f"{case['label'] or case['predicted']} (similarity {case['similarity']:.2f})"
+            if os.path.exists(case['source']):
+                st.image(case['source'], caption=caption, use_column_width=True)
+            else:
+                st.write(f"{os.path.basename(case['source'])}: {caption}")
+
+# Function to add a prediction to the user's history. It is only queued here; the database write
+# happens in the background, so recording adds no round-trip to the prediction.
+def record_prediction(disease, features, model_version, result, latency_ms):
+    get_history_recorder().record(st.session_state.get('username'), disease, features, model_version, result, latency_ms)
+
+# Function to show the user's predictions, newest first, one page at a time
+def history_page(page_size=20):
+    # Ids the pages shown so far start before; the last one is the current page (None = newest)
+    if 'history_cursors' not in st.session_state:
+        st.session_state['history_cursors'] = [None]
+    cursors = st.session_state['history_cursors']
+    try:
+        ensure_history_schema()
+        rows = history.fetch_history(get_db_pool(), st.session_state['username'], page_size + 1, cursors[-1])
+    except Exception as e:
+        st.error(f"Prediction history is unavailable: {str(e)}")
+        return
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if rows:
+        st.table([{
+            'Time (UTC)': row['created_at'],
+            'Disease': row['disease'],
+            'Result': row['result'],
+            'Model': row['model_version'],
+            'Latency (ms)': f"{row['latency_ms']:.1f}",
+        } for row in rows])
+    else:
+        st.info("No predictions recorded yet.")
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("Newer"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if has_more and st.button("Older"):
+            cursors.append(rows[-1]['id'])
+            st.rerun()
+
+# Function to show how far recent inputs have drifted from the training data, per disease and feature
+def drift_page():
+    if not drift.ENABLED:
+        st.info("Drift monitoring is turned off. Build the reference with `python drift.py build`, or set DRIFT_MONITOR=1.")
+        return
+    scores = predictors.get_drift_monitor().scores()
+    if not scores:
+        st.info("No drift scores yet. They are computed on a schedule (every DRIFT_INTERVAL seconds) once predictions are made.")
+        return
+    titles = {'diabetes': 'Diabetes', 'heart': 'Heart Disease', 'parkinsons': "Parkinson's Disease"}
+    st.caption(f"Updated {time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(max(e['updated_at'] for e in scores.values())))}. "
+               f"PSI below {drift.PSI_MODERATE} is stable, above {drift.PSI_MAJOR} is a major shift. A feature is only "
+               f"flagged when its inputs also differ from the training data by more than chance (chi-square test).")
+    for disease, entry in scores.items():
+        st.markdown(f"**{titles.get(disease, disease)}**: {entry['status']} ({entry['samples']:.0f} recent inputs)")
+        if entry['features']:
+            st.table([{
+                'Feature': feature['feature'],
+                'PSI': f"{feature['psi']:.3f}",
+                'KS': f"{feature['ks']:.3f}",
+                'Chi-square': f"{feature['chi2']:.1f}",
+                'Status': feature['status'],
+            } for feature in sorted(entry['features'], key=lambda f: f['psi'], reverse=True)])
+
+# Run a function as a fragment where Streamlit supports it, so submitting its form reruns only that function
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda fn: fn)
+
+# Function to get the number of decimals shown for a float field, enough for its smallest bound
+def field_decimals(field):
+    smallest = min(abs(bound) for bound in (field.min, field.max) if bound)
+    return max(2, int(np.ceil(-np.log10(smallest))) + 2)
+
+# Function to draw the typed input widget of a schema field; returns the value, or None when it is left empty
+def field_input(field, current, label=None, key=None):
+    label = label or field.prompt or field.label
+    value = None if np.isnan(current) else field.dtype(current)
+    if field.allowed:
+        options = list(field.allowed)
+        index = options.index(value) if value in options else None
+        return st.selectbox(label, options, index=index, help=field.help, key=key)
+    if field.dtype is int:
+        return st.number_input(label, value=value, step=1, help=field.help, key=key)
+    decimals = field_decimals(field)
+    return st.number_input(label, value=value, step=10.0 ** -decimals, format=f"%.{decimals}f",
+                           help=field.help, key=key)
+
+# Function to draw the form of a tabular disease and, once it is submitted, the result.
+# Typing into the form does not rerun the script; submitting it reruns only this fragment.
+@fragment
+def tabular_form(disease, button, outcomes, columns=3):
+    state = st.session_state[f'{disease}_values']
+    with st.form(f'{disease}_form'):
+        cols = st.columns(columns)
+        entered = []
+        for j, field in enumerate(validation.SCHEMAS[disease]):
+            with cols[j % columns]:
+                entered.append(field_input(field, state[j]))
+        submitted = st.form_submit_button(button)
+
+    if submitted:
+        with instrumentation.span(f'parse.{disease}'):
+            state[:] = [np.nan if value is None else value for value in entered]
+            values = state[np.newaxis].copy()
+        invalid = validation.validate(disease, values)
+        if invalid.any():
+            # Show every invalid field at once instead of stopping at the first one
+            for message in validation.row_errors(disease, values[0], invalid[0]):
+                st.error(message)
+        else:
+            started = time.perf_counter()
+            prediction = predict_tabular(disease, values)
+            record_prediction(disease, values[0].tolist(), model_registry.get_version(disease),
+                              'positive' if prediction[0] == 1 else 'negative', (time.perf_counter() - started) * 1000)
+            positive, negative = outcomes
+            st.success(positive if prediction[0] == 1 else negative)
+            show_risk(disease, values)
+
+# Function to draw the full screening form and, once it is submitted, the consolidated report
+@fragment
+def screening_form():
+    section_titles = {'diabetes': 'Diabetes', 'heart': 'Heart Disease', 'parkinsons': "Parkinson's Disease"}
+    fields = screening.union_fields()
+    index = {key: i for i, (key, _, _) in enumerate(fields)}
+    shared = [(key, field) for key, field, diseases in fields if len(diseases) > 1]
+    sections = [('Shared', shared)] + [
+        (section_titles[disease], [(key, field) for key, field, diseases in fields if diseases == [disease]])
+        for disease in section_titles
+    ]
+    state = st.session_state['screening_values']
+    with st.form('screening_form'):
+        entered = {}
+        for title, section_fields in sections:
+            st.markdown(f"**{title}**")
+            columns = st.columns(4)
+            for i, (key, field) in enumerate(section_fields):
+                with columns[i % 4]:
+                    entered[key] = field_input(
+                        field, state[index[key]],
+                        label=field.label if field.label == field.column else f"{field.label} ({field.column})",
+                        key=f"screening_{key}")
+
+        xray = st.file_uploader("Lung X-Ray Image (optional)", type=["jpg", "jpeg", "png"], key="screening_xray")
+        submitted = st.form_submit_button("Run Screening")
+
+    if submitted:
+        for key, value in entered.items():
+            state[index[key]] = np.nan if value is None else value
+        # All applicable models run in parallel, so this takes as long as the slowest one
+        inputs = {key: value for key, value in entered.items() if value is not None}
+        image_bytes = xray.getvalue() if xray is not None else None
+        started = time.perf_counter()
+        report = screening.screen(inputs, image_bytes)
+        latency_ms = (time.perf_counter() - started) * 1000
+        for disease, result in report.items():
+            if result['status'] in ('skipped', 'invalid', 'error'):
+                continue
+            if disease == 'covid':
+                record_prediction(disease, {'image_sha256': hashlib.sha256(image_bytes).hexdigest()},
+                                  covid_model.classifier_version(), result['status'], latency_ms)
+            else:
+                features = [float(value) for value in screening.disease_inputs(disease, inputs).values()]
+                record_prediction(disease, features, model_registry.get_version(disease), result['status'], latency_ms)
+        outcome = {
+            'diabetes': ('The person is diabetic', 'The person is not diabetic'),
+            'heart': ('The person is having heart disease', 'The person does not have any heart disease'),
+            'parkinsons': ("The person has Parkinson's disease", "The person does not have Parkinson's disease"),
+        }
+        for disease, result in report.items():
+            title = section_titles.get(disease, 'COVID-19')
+            if result['status'] == 'skipped':
+                st.info(f"{title}: skipped (not all fields were filled in)")
+            elif result['status'] in ('invalid', 'error'):
+                st.error(f"{title}: " + " ".join(result['errors']))
+            elif disease == 'covid':
+                probabilities = ", ".join(f"{name}: {p * 100:.2f}%" for name, p in result['probabilities'].items())
+                st.success(f"{title}: the X-ray is classified as *{result['status']}* ({probabilities})")
+            else:
+                positive, negative = outcome[disease]
+                st.success(f"{title}: {positive if result['status'] == 'positive' else negative}")
 
 # Initialize session state
 if 'logged_in' not in st.session_state:
     st.session_state['logged_in'] = False
 
-# Initialize session state for input fields
-if 'diabetes_inputs' not in st.session_state:
-    st.session_state['diabetes_inputs'] = {
-        'Pregnancies': '',
-        'Glucose': '',
-        'BloodPressure': '',
-        'SkinThickness': '',
-        'Insulin': '',
-        'BMI': '',
-        'DiabetesPedigreeFunction': '',
-        'Age': ''
-    }
-
-if 'heart_disease_inputs' not in st.session_state:
-    st.session_state['heart_disease_inputs'] = {
-        'age': '',
-        'sex': '',
-        'cp': '',
-        'trestbps': '',
-        'chol': '',
-        'fbs': '',
-        'restecg': '',
-        'thalach': '',
-        'exang': '',
-        'oldpeak': '',
-        'slope': '',
-        'ca': '',
-        'thal': ''
-    }
-
-if 'parkinsons_inputs' not in st.session_state:
-    st.session_state['parkinsons_inputs'] = {
-        'fo': '',
-        'fhi': '',
-        'flo': '',
-        'Jitter_percent': '',
-        'Jitter_Abs': '',
-        'RAP': '',
-        'PPQ': '',
-        'DDP': '',
-        'Shimmer': '',
-        'Shimmer_dB': '',
-        'APQ3': '',
-        'APQ5': '',
-        'APQ': '',
-        'DDA': '',
-        'NHR': '',
-        'HNR': '',
-        'RPDE': '',
-        'DFA': '',
-        'spread1': '',
-        'spread2': '',
-        'D2': '',
-        'PPE': ''
-    }
+# Form values of each session: one float array per form, in schema order (NaN = not entered yet).
+# A few hundred bytes per session instead of a dict of strings per field.
+for disease, schema in validation.SCHEMAS.items():
+    if f'{disease}_values' not in st.session_state:
+        st.session_state[f'{disease}_values'] = np.full(len(schema), np.nan)
+if 'screening_values' not in st.session_state:
+    st.session_state['screening_values'] = np.full(len(screening.union_fields()), np.nan)
 
 # Track the previously selected page to detect page changes
 if 'previous_page' not in st.session_state:
@@ -138,6 +309,7 @@ def login_signup_page():
             if user:
                 st.session_state['logged_in'] = True
                 st.session_state['username'] = username
+                st.session_state['auth_token'] = auth.create_token(username)
                 st.success("Logged in successfully!")
             else:
                 st.error("Invalid username or password")
@@ -149,11 +321,12 @@ def login_signup_page():
         confirm_password = st.text_input("Confirm Password", type='password')
 
         if st.button("Sign Up"):
-            if new_password == confirm_password:
-                create_user(new_username, new_password)
+            if new_password != confirm_password:
+                st.error("Passwords do not match")
+            elif create_user(new_username, new_password):
                 st.success("Account created successfully! Please login.")
             else:
-                st.error("Passwords do not match")
+                st.error("That username is already taken")
 
 # Main App
 def main_app():
@@ -162,8 +335,11 @@ def main_app():
                                ['Diabetes Prediction',
                                 'Heart Disease Prediction',
                                 'Parkinsons Prediction',
-                                'COVID-19 Detection'],
-                               icons=['activity', 'heart', 'person', 'lungs'],
+                                'COVID-19 Detection',
+                                'Full Screening',
+                                'Prediction History',
+                                'Input Drift'],
+                               icons=['activity', 'heart', 'person', 'lungs', 'clipboard2-pulse', 'clock-history', 'graph-up'],
                                default_index=0)
 
 
@@ -171,17 +347,21 @@ def main_app():
         if st.button("Logout"):
             st.session_state['logged_in'] = False
             st.session_state['username'] = None
+            st.session_state['auth_token'] = None
             st.success("Logged out successfully!")
             st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
 
-    # Detect page change and clear inputs for the previous page
+    # Detect page change and clear the form values of the previous page
+    page_values = {
+        'Diabetes Prediction': 'diabetes_values',
+        'Heart Disease Prediction': 'heart_values',
+        'Parkinsons Prediction': 'parkinsons_values',
+        'Full Screening': 'screening_values',
+    }
     if st.session_state['previous_page'] != selected:
-        if st.session_state['previous_page'] == 'Diabetes Prediction':
-            st.session_state['diabetes_inputs'] = {key: '' for key in st.session_state['diabetes_inputs']}
-        elif st.session_state['previous_page'] == 'Heart Disease Prediction':
-            st.session_state['heart_disease_inputs'] = {key: '' for key in st.session_state['heart_disease_inputs']}
-        elif st.session_state['previous_page'] == 'Parkinsons Prediction':
-            st.session_state['parkinsons_inputs'] = {key: '' for key in st.session_state['parkinsons_inputs']}
+        if st.session_state['previous_page'] in page_values:
+            st.session_state[page_values[st.session_state['previous_page']]].fill(np.nan)
+        st.session_state.pop('history_cursors', None)
 
         # Update the previous page to the current selection
         st.session_state['previous_page'] = selected
@@ -190,386 +370,44 @@ def main_app():
 
     if selected == 'Diabetes Prediction':
         st.subheader('Diabetes Prediction')
-        # Display the diabetes prediction features table
-         
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.session_state['diabetes_inputs']['Pregnancies'] = st.text_input('Number of Pregnancies', 
-                help="Number of times the person has been pregnant (Normal: 0-15)", 
-                value=st.session_state['diabetes_inputs']['Pregnancies'])
-        with col2:
-            st.session_state['diabetes_inputs']['Glucose'] = st.text_input('Glucose Level', 
-                help="Glucose level in the blood (mg/dL) (Normal: 70-140, Max: 200)", 
-                value=st.session_state['diabetes_inputs']['Glucose'])
-        with col3:
-            st.session_state['diabetes_inputs']['BloodPressure'] = st.text_input('Blood Pressure value', 
-                help="Diastolic blood pressure (mm Hg) (Normal: 60-90, Max: 120)", 
-                value=st.session_state['diabetes_inputs']['BloodPressure'])
-        with col1:
-            st.session_state['diabetes_inputs']['SkinThickness'] = st.text_input('Skin Thickness value', 
-                help="Thickness of the skin fold on the triceps (mm) (Normal: 10-30, Max: 50)", 
-                value=st.session_state['diabetes_inputs']['SkinThickness'])
-        with col2:
-            st.session_state['diabetes_inputs']['Insulin'] = st.text_input('Insulin Level', 
-                help="2-Hour serum insulin (mu U/ml) (Normal: 16-166, Max: 846)", 
-                value=st.session_state['diabetes_inputs']['Insulin'])
-        with col3:
-            st.session_state['diabetes_inputs']['BMI'] = st.text_input('BMI value', 
-                help="Body Mass Index (weight in kg/(height in m)^2) (Normal: 18.5-24.9, Max: 60)", 
-                value=st.session_state['diabetes_inputs']['BMI'])
-        with col1:
-            st.session_state['diabetes_inputs']['DiabetesPedigreeFunction'] = st.text_input('Diabetes Pedigree Function value', 
-                help="A function that scores the likelihood of diabetes based on family history (Normal: 0.078-2.42, Max: 2.5)", 
-                value=st.session_state['diabetes_inputs']['DiabetesPedigreeFunction'])
-        with col2:
-            st.session_state['diabetes_inputs']['Age'] = st.text_input('Age of the Person', 
-                help="Age in years (Normal: 21-81, Max: 120)", 
-                value=st.session_state['diabetes_inputs']['Age'])
-
-        if st.button('Diabetes Test Result'):
-            try:
-                Pregnancies = int(st.session_state['diabetes_inputs']['Pregnancies'])
-                Glucose = int(st.session_state['diabetes_inputs']['Glucose'])
-                BloodPressure = int(st.session_state['diabetes_inputs']['BloodPressure'])
-                SkinThickness = int(st.session_state['diabetes_inputs']['SkinThickness'])
-                Insulin = int(st.session_state['diabetes_inputs']['Insulin'])
-                BMI = float(st.session_state['diabetes_inputs']['BMI'])
-                DiabetesPedigreeFunction = float(st.session_state['diabetes_inputs']['DiabetesPedigreeFunction'])
-                Age = int(st.session_state['diabetes_inputs']['Age'])
-
-                # Validate inputs
-                if not (0 <= Pregnancies <= 15):
-                    st.error(f"Number of Pregnancies must be between 0 and 15. You entered: {Pregnancies}")
-                elif not (70 <= Glucose <= 200):
-                    st.error(f"Glucose level must be between 70 and 200. You entered: {Glucose}")
-                elif not (60 <= BloodPressure <= 120):
-                    st.error(f"Blood Pressure must be between 60 and 120. You entered: {BloodPressure}")
-                elif not (10 <= SkinThickness <= 50):
-                    st.error(f"Skin Thickness must be between 10 and 50. You entered: {SkinThickness}")
-                elif not (16 <= Insulin <= 846):
-                    st.error(f"Insulin level must be between 16 and 846. You entered: {Insulin}")
-                elif not (18.5 <= BMI <= 60):
-                    st.error(f"BMI must be between 18.5 and 60. You entered: {BMI}")
-                elif not (0.078 <= DiabetesPedigreeFunction <= 2.5):
-                    st.error(f"Diabetes Pedigree Function must be between 0.078 and 2.5. You entered: {DiabetesPedigreeFunction}")
-                elif not (21 <= Age <= 120):
-                    st.error(f"Age must be between 21 and 120. You entered: {Age}")
-                else:
-                    diab_prediction = diabetes_model.predict([[Pregnancies, Glucose, BloodPressure, SkinThickness, Insulin, BMI, DiabetesPedigreeFunction, Age]])
-                    if diab_prediction[0] == 1:
-                        st.success('The person is diabetic')
-                    else:
-                        st.success('The person is not diabetic')
-            except ValueError:
-                st.error("Please enter valid numeric values for all fields.")
+        tabular_form('diabetes', 'Diabetes Test Result',
+                     ('The person is diabetic', 'The person is not diabetic'))
 
     elif selected == 'Heart Disease Prediction':
         st.subheader('Heart Disease Prediction')
-        # Display the heart disease prediction features table 
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.session_state['heart_disease_inputs']['age'] = st.text_input('Age', 
-                help="Age in years (Normal: 20-80, Max: 120)", 
-                value=st.session_state['heart_disease_inputs']['age'])
-        with col2:
-            st.session_state['heart_disease_inputs']['sex'] = st.text_input('Sex', 
-                help="Sex (1 = male; 0 = female)", 
-                value=st.session_state['heart_disease_inputs']['sex'])
-        with col3:
-            st.session_state['heart_disease_inputs']['cp'] = st.text_input('Chest Pain types', 
-                help="Chest pain type (0 = typical angina; 1 = atypical angina; 2 = non-anginal pain; 3 = asymptomatic)", 
-                value=st.session_state['heart_disease_inputs']['cp'])
-        with col1:
-            st.session_state['heart_disease_inputs']['trestbps'] = st.text_input('Resting Blood Pressure', 
-                help="Resting blood pressure (mm Hg) (Normal: 80-120, Max: 200)", 
-                value=st.session_state['heart_disease_inputs']['trestbps'])
-        with col2:
-            st.session_state['heart_disease_inputs']['chol'] = st.text_input('Serum Cholestoral in mg/dl', 
-                help="Serum cholesterol level (mg/dL) (Normal: 120-240, Max: 600)", 
-                value=st.session_state['heart_disease_inputs']['chol'])
-        with col3:
-            st.session_state['heart_disease_inputs']['fbs'] = st.text_input('Fasting Blood Sugar > 120 mg/dl', 
-                help="Fasting blood sugar > 120 mg/dL (1 = true; 0 = false)", 
-                value=st.session_state['heart_disease_inputs']['fbs'])
-        with col1:
-            st.session_state['heart_disease_inputs']['restecg'] = st.text_input('Resting Electrocardiographic results', 
-                help="Resting electrocardiographic results (0 = normal; 1 = ST-T wave abnormality; 2 = probable or definite left ventricular hypertrophy)", 
-                value=st.session_state['heart_disease_inputs']['restecg'])
-        with col2:
-            st.session_state['heart_disease_inputs']['thalach'] = st.text_input('Maximum Heart Rate achieved', 
-                help="Maximum heart rate achieved during exercise (Normal: 60-100, Max: 220)", 
-                value=st.session_state['heart_disease_inputs']['thalach'])
-        with col3:
-            st.session_state['heart_disease_inputs']['exang'] = st.text_input('Exercise Induced Angina', 
-                help="Exercise-induced angina (1 = yes; 0 = no)", 
-                value=st.session_state['heart_disease_inputs']['exang'])
-        with col1:
-            st.session_state['heart_disease_inputs']['oldpeak'] = st.text_input('ST depression induced by exercise', 
-                help="ST depression induced by exercise relative to rest (Normal: 0-2, Max: 6)", 
-                value=st.session_state['heart_disease_inputs']['oldpeak'])
-        with col2:
-            st.session_state['heart_disease_inputs']['slope'] = st.text_input('Slope of the peak exercise ST segment', 
-                help="Slope of the peak exercise ST segment (0 = upsloping; 1 = flat; 2 = downsloping)", 
-                value=st.session_state['heart_disease_inputs']['slope'])
-        with col3:
-            st.session_state['heart_disease_inputs']['ca'] = st.text_input('Major vessels colored by fluoroscopy', 
-                help="Number of major vessels colored by fluoroscopy (0-3)", 
-                value=st.session_state['heart_disease_inputs']['ca'])
-        with col1:
-            st.session_state['heart_disease_inputs']['thal'] = st.text_input('thal: 0 = normal; 1 = fixed defect; 2 = reversible defect', 
-                help="Thalassemia (0 = normal; 1 = fixed defect; 2 = reversible defect)", 
-                value=st.session_state['heart_disease_inputs']['thal'])
-
-        if st.button('Heart Disease Test Result'):
-            try:
-                age = int(st.session_state['heart_disease_inputs']['age'])
-                sex = int(st.session_state['heart_disease_inputs']['sex'])
-                cp = int(st.session_state['heart_disease_inputs']['cp'])
-                trestbps = int(st.session_state['heart_disease_inputs']['trestbps'])
-                chol = int(st.session_state['heart_disease_inputs']['chol'])
-                fbs = int(st.session_state['heart_disease_inputs']['fbs'])
-                restecg = int(st.session_state['heart_disease_inputs']['restecg'])
-                thalach = int(st.session_state['heart_disease_inputs']['thalach'])
-                exang = int(st.session_state['heart_disease_inputs']['exang'])
-                oldpeak = float(st.session_state['heart_disease_inputs']['oldpeak'])
-                slope = int(st.session_state['heart_disease_inputs']['slope'])
-                ca = int(st.session_state['heart_disease_inputs']['ca'])
-                thal = int(st.session_state['heart_disease_inputs']['thal'])
-
-                # Validate inputs
-                if not (20 <= age <= 120):
-                    st.error(f"Age must be between 20 and 120. You entered: {age}")
-                elif not (sex in [0, 1]):
-                    st.error(f"Sex must be either 0 or 1. You entered: {sex}")
-                elif not (cp in [0, 1, 2, 3]):
-                    st.error(f"Chest Pain type must be 0, 1, 2, or 3. You entered: {cp}")
-                elif not (80 <= trestbps <= 200):
-                    st.error(f"Resting Blood Pressure must be between 80 and 200. You entered: {trestbps}")
-                elif not (120 <= chol <= 600):
-                    st.error(f"Cholesterol must be between 120 and 600. You entered: {chol}")
-                elif not (fbs in [0, 1]):
-                    st.error(f"Fasting Blood Sugar must be either 0 or 1. You entered: {fbs}")
-                elif not (restecg in [0, 1, 2]):
-                    st.error(f"Resting ECG must be 0, 1, or 2. You entered: {restecg}")
-                elif not (60 <= thalach <= 220):
-                    st.error(f"Maximum Heart Rate must be between 60 and 220. You entered: {thalach}")
-                elif not (exang in [0, 1]):
-                    st.error(f"Exercise Induced Angina must be either 0 or 1. You entered: {exang}")
-                elif not (0 <= oldpeak <= 6):
-                    st.error(f"ST Depression must be between 0 and 6. You entered: {oldpeak}")
-                elif not (slope in [0, 1, 2]):
-                    st.error(f"Slope must be 0, 1, or 2. You entered: {slope}")
-                elif not (0 <= ca <= 3):
-                    st.error(f"Major Vessels Colored must be between 0 and 3. You entered: {ca}")
-                elif not (thal in [0, 1, 2]):
-                    st.error(f"Thalassemia must be 0, 1, or 2. You entered: {thal}")
-                else:
-                    heart_prediction = heart_disease_model.predict([[age, sex, cp, trestbps, chol, fbs, restecg, thalach, exang, oldpeak, slope, ca, thal]])
-                    if heart_prediction[0] == 1:
-                        st.success('The person is having heart disease')
-                    else:
-                        st.success('The person does not have any heart disease')
-            except ValueError:
-                st.error("Please enter valid numeric values for all fields.")
+        tabular_form('heart', 'Heart Disease Test Result',
+                     ('The person is having heart disease', 'The person does not have any heart disease'))
 
     elif selected == "Parkinsons Prediction":
         st.subheader("Parkinson's Disease Prediction")
-        # Display the Parkinson's disease prediction features table 
-        
-        col1, col2, col3, col4, col5 = st.columns(5)
-        with col1:
-            st.session_state['parkinsons_inputs']['fo'] = st.text_input('MDVP:Fo(Hz)', 
-                help="Average vocal fundamental frequency (Normal: 85-260 Hz, Max: 300)", 
-                value=st.session_state['parkinsons_inputs']['fo'])
-        with col2:
-            st.session_state['parkinsons_inputs']['fhi'] = st.text_input('MDVP:Fhi(Hz)', 
-                help="Maximum vocal fundamental frequency (Normal: 100-500 Hz, Max: 600)", 
-                value=st.session_state['parkinsons_inputs']['fhi'])
-        with col3:
-            st.session_state['parkinsons_inputs']['flo'] = st.text_input('MDVP:Flo(Hz)', 
-                help="Minimum vocal fundamental frequency (Normal: 60-180 Hz, Max: 200)", 
-                value=st.session_state['parkinsons_inputs']['flo'])
-        with col4:
-            st.session_state['parkinsons_inputs']['Jitter_percent'] = st.text_input('MDVP:Jitter(%)', 
-                help="Jitter as a percentage of the fundamental frequency (Normal: 0.001-0.01%, Max: 0.02%)", 
-                value=st.session_state['parkinsons_inputs']['Jitter_percent'])
-        with col5:
-            st.session_state['parkinsons_inputs']['Jitter_Abs'] = st.text_input('MDVP:Jitter(Abs)', 
-                help="Absolute jitter value (Normal: 0.00001-0.0001, Max: 0.0002)", 
-                value=st.session_state['parkinsons_inputs']['Jitter_Abs'])
-        with col1:
-            st.session_state['parkinsons_inputs']['RAP'] = st.text_input('MDVP:RAP', 
-                help="Relative amplitude perturbation (Normal: 0.001-0.01, Max: 0.02)", 
-                value=st.session_state['parkinsons_inputs']['RAP'])
-        with col2:
-            st.session_state['parkinsons_inputs']['PPQ'] = st.text_input('MDVP:PPQ', 
-                help="Five-point period perturbation quotient (Normal: 0.001-0.01, Max: 0.02)", 
-                value=st.session_state['parkinsons_inputs']['PPQ'])
-        with col3:
-            st.session_state['parkinsons_inputs']['DDP'] = st.text_input('Jitter:DDP', 
-                help="Average absolute difference of differences between consecutive periods (Normal: 0.001-0.01, Max: 0.02)", 
-                value=st.session_state['parkinsons_inputs']['DDP'])
-        with col4:
-            st.session_state['parkinsons_inputs']['Shimmer'] = st.text_input('MDVP:Shimmer', 
-                help="Shimmer (amplitude variation) (Normal: 0.01-0.05, Max: 0.1)", 
-                value=st.session_state['parkinsons_inputs']['Shimmer'])
-        with col5:
-            st.session_state['parkinsons_inputs']['Shimmer_dB'] = st.text_input('MDVP:Shimmer(dB)', 
-                help="Shimmer in decibels (Normal: 0.1-0.5 dB, Max: 1.0)", 
-                value=st.session_state['parkinsons_inputs']['Shimmer_dB'])
-        with col1:
-            st.session_state['parkinsons_inputs']['APQ3'] = st.text_input('Shimmer:APQ3', 
-                help="Amplitude perturbation quotient over three points (Normal: 0.01-0.05, Max: 0.1)", 
-                value=st.session_state['parkinsons_inputs']['APQ3'])
-        with col2:
-            st.session_state['parkinsons_inputs']['APQ5'] = st.text_input('Shimmer:APQ5', 
-                help="Amplitude perturbation quotient over five points (Normal: 0.01-0.05, Max: 0.1)", 
-                value=st.session_state['parkinsons_inputs']['APQ5'])
-        with col3:
-            st.session_state['parkinsons_inputs']['APQ'] = st.text_input('MDVP:APQ', 
-                help="Amplitude perturbation quotient (Normal: 0.01-0.05, Max: 0.1)", 
-                value=st.session_state['parkinsons_inputs']['APQ'])
-        with col4:
-            st.session_state['parkinsons_inputs']['DDA'] = st.text_input('Shimmer:DDA', 
-                help="Average absolute difference between consecutive differences of amplitudes (Normal: 0.01-0.05, Max: 0.1)", 
-                value=st.session_state['parkinsons_inputs']['DDA'])
-        with col5:
-            st.session_state['parkinsons_inputs']['NHR'] = st.text_input('NHR', 
-                help="Noise-to-harmonics ratio (Normal: 0.01-0.1, Max: 0.2)", 
-                value=st.session_state['parkinsons_inputs']['NHR'])
-        with col1:
-            st.session_state['parkinsons_inputs']['HNR'] = st.text_input('HNR', 
-                help="Harmonics-to-noise ratio (Normal: 20-30 dB, Max: 40)", 
-                value=st.session_state['parkinsons_inputs']['HNR'])
-        with col2:
-            st.session_state['parkinsons_inputs']['RPDE'] = st.text_input('RPDE', 
-                help="Recurrence period density entropy (Normal: 0.1-0.6, Max: 1.0)", 
-                value=st.session_state['parkinsons_inputs']['RPDE'])
-        with col3:
-            st.session_state['parkinsons_inputs']['DFA'] = st.text_input('DFA', 
-                help="Detrended fluctuation analysis (Normal: 0.5-1.5, Max: 2.0)", 
-                value=st.session_state['parkinsons_inputs']['DFA'])
-        with col4:
-            st.session_state['parkinsons_inputs']['spread1'] = st.text_input('spread1', 
-                help="Nonlinear measure of fundamental frequency variation (Normal: -7 to -2, Max: 0)", 
-                value=st.session_state['parkinsons_inputs']['spread1'])
-        with col5:
-            st.session_state['parkinsons_inputs']['spread2'] = st.text_input('spread2', 
-                help="Nonlinear measure of fundamental frequency variation (Normal: 0.01-0.2, Max: 0.3)", 
-                value=st.session_state['parkinsons_inputs']['spread2'])
-        with col1:
-            st.session_state['parkinsons_inputs']['D2'] = st.text_input('D2', 
-                help="Correlation dimension (Normal: 1.5-2.5, Max: 3.0)", 
-                value=st.session_state['parkinsons_inputs']['D2'])
-        with col2:
-            st.session_state['parkinsons_inputs']['PPE'] = st.text_input('PPE', 
-                help="Pitch period entropy (Normal: 0.1-0.5, Max: 1.0)", 
-                value=st.session_state['parkinsons_inputs']['PPE'])
-
-        if st.button("Parkinson's Test Result"):
-            try:
-                fo = float(st.session_state['parkinsons_inputs']['fo'])
-                fhi = float(st.session_state['parkinsons_inputs']['fhi'])
-                flo = float(st.session_state['parkinsons_inputs']['flo'])
-                Jitter_percent = float(st.session_state['parkinsons_inputs']['Jitter_percent'])
-                Jitter_Abs = float(st.session_state['parkinsons_inputs']['Jitter_Abs'])
-                RAP = float(st.session_state['parkinsons_inputs']['RAP'])
-                PPQ = float(st.session_state['parkinsons_inputs']['PPQ'])
-                DDP = float(st.session_state['parkinsons_inputs']['DDP'])
-                Shimmer = float(st.session_state['parkinsons_inputs']['Shimmer'])
-                Shimmer_dB = float(st.session_state['parkinsons_inputs']['Shimmer_dB'])
-                APQ3 = float(st.session_state['parkinsons_inputs']['APQ3'])
-                APQ5 = float(st.session_state['parkinsons_inputs']['APQ5'])
-                APQ = float(st.session_state['parkinsons_inputs']['APQ'])
-                DDA = float(st.session_state['parkinsons_inputs']['DDA'])
-                NHR = float(st.session_state['parkinsons_inputs']['NHR'])
-                HNR = float(st.session_state['parkinsons_inputs']['HNR'])
-                RPDE = float(st.session_state['parkinsons_inputs']['RPDE'])
-                DFA = float(st.session_state['parkinsons_inputs']['DFA'])
-                spread1 = float(st.session_state['parkinsons_inputs']['spread1'])
-                spread2 = float(st.session_state['parkinsons_inputs']['spread2'])
-                D2 = float(st.session_state['parkinsons_inputs']['D2'])
-                PPE = float(st.session_state['parkinsons_inputs']['PPE'])
-
-                # Validate inputs
-                if not (85 <= fo <= 300):
-                    st.error(f"MDVP:Fo(Hz) must be between 85 and 300. You entered: {fo}")
-                elif not (100 <= fhi <= 600):
-                    st.error(f"MDVP:Fhi(Hz) must be between 100 and 600. You entered: {fhi}")
-                elif not (60 <= flo <= 200):
-                    st.error(f"MDVP:Flo(Hz) must be between 60 and 200. You entered: {flo}")
-                elif not (0.001 <= Jitter_percent <= 0.02):
-                    st.error(f"MDVP:Jitter(%) must be between 0.001 and 0.02. You entered: {Jitter_percent}")
-                elif not (0.00001 <= Jitter_Abs <= 0.0002):
-                    st.error(f"MDVP:Jitter(Abs) must be between 0.00001 and 0.0002. You entered: {Jitter_Abs}")
-                elif not (0.001 <= RAP <= 0.02):
-                    st.error(f"MDVP:RAP must be between 0.001 and 0.02. You entered: {RAP}")
-                elif not (0.001 <= PPQ <= 0.02):
-                    st.error(f"MDVP:PPQ must be between 0.001 and 0.02. You entered: {PPQ}")
-                elif not (0.001 <= DDP <= 0.02):
-                    st.error(f"Jitter:DDP must be between 0.001 and 0.02. You entered: {DDP}")
-                elif not (0.01 <= Shimmer <= 0.1):
-                    st.error(f"MDVP:Shimmer must be between 0.01 and 0.1. You entered: {Shimmer}")
-                elif not (0.1 <= Shimmer_dB <= 1.0):
-                    st.error(f"MDVP:Shimmer(dB) must be between 0.1 and 1.0. You entered: {Shimmer_dB}")
-                elif not (0.01 <= APQ3 <= 0.1):
-                    st.error(f"Shimmer:APQ3 must be between 0.01 and 0.1. You entered: {APQ3}")
-                elif not (0.01 <= APQ5 <= 0.1):
-                    st.error(f"Shimmer:APQ5 must be between 0.01 and 0.1. You entered: {APQ5}")
-                elif not (0.01 <= APQ <= 0.1):
-                    st.error(f"MDVP:APQ must be between 0.01 and 0.1. You entered: {APQ}")
-                elif not (0.01 <= DDA <= 0.1):
-                    st.error(f"Shimmer:DDA must be between 0.01 and 0.1. You entered: {DDA}")
-                elif not (0.01 <= NHR <= 0.2):
-                    st.error(f"NHR must be between 0.01 and 0.2. You entered: {NHR}")
-                elif not (20 <= HNR <= 40):
-                    st.error(f"HNR must be between 20 and 40. You entered: {HNR}")
-                elif not (0.1 <= RPDE <= 1.0):
-                    st.error(f"RPDE must be between 0.1 and 1.0. You entered: {RPDE}")
-                elif not (0.5 <= DFA <= 2.0):
-                    st.error(f"DFA must be between 0.5 and 2.0. You entered: {DFA}")
-                elif not (-7 <= spread1 <= 0):
-                    st.error(f"spread1 must be between -7 and 0. You entered: {spread1}")
-                elif not (0.01 <= spread2 <= 0.3):
-                    st.error(f"spread2 must be between 0.01 and 0.3. You entered: {spread2}")
-                elif not (1.5 <= D2 <= 3.0):
-                    st.error(f"D2 must be between 1.5 and 3.0. You entered: {D2}")
-                elif not (0.1 <= PPE <= 1.0):
-                    st.error(f"PPE must be between 0.1 and 1.0. You entered: {PPE}")
-                else:
-                    parkinsons_prediction = parkinsons_model.predict([[fo, fhi, flo, Jitter_percent, Jitter_Abs, RAP, PPQ, DDP, Shimmer, Shimmer_dB, APQ3, APQ5, APQ, DDA, NHR, HNR, RPDE, DFA, spread1, spread2, D2, PPE]])
-                    if parkinsons_prediction[0] == 1:
-                        st.success("The person has Parkinson's disease")
-                    else:
-                        st.success("The person does not have Parkinson's disease")
-            except ValueError:
-                st.error("Please enter valid numeric values for all fields.")
+        tabular_form('parkinsons', "Parkinson's Test Result",
+                     ("The person has Parkinson's disease", "The person does not have Parkinson's disease"), columns=5)
     elif selected == 'COVID-19 Detection':
         st.subheader("COVID-19 Lung X-Ray Classification")
         st.write("Upload a lung X-ray image to classify it into one of the following categories: Normal, Lung Opacity, Viral Pneumonia, or COVID.")
 
-        # File uploader for the lung image
-        uploaded_file = st.file_uploader("Upload Lung X-Ray Image", type=["jpg", "jpeg", "png"])
-        if uploaded_file is not None:
+        # File uploader for the lung images; several images are classified together in batches
+        uploaded_files = st.file_uploader("Upload Lung X-Ray Image", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+        if len(uploaded_files) == 1:
+            uploaded_file = uploaded_files[0]
             # Display the uploaded image
             image = Image.open(uploaded_file)
             st.image(image, caption="Uploaded Lung X-Ray Image", use_column_width=True)
 
-            # Preprocess the image for the model
-            img_array = preprocess_image(image)
-
             # Predict using the model
             if st.button("Classify Image"):
                 try:
-                    model = load_covid_model()
-                    prediction = model.predict(img_array)
+                    # Preprocessing and prediction are cached, so re-classifying the same upload is free
+                    started = time.perf_counter()
+                    prediction, embeddings = predictors.classify_images([uploaded_file.getvalue()])
+                    latency_ms = (time.perf_counter() - started) * 1000
                     predicted_class = np.argmax(prediction, axis=1)[0]
 
                     # Define class names
-                    class_names = ["Normal", "Lung Opacity", "Viral Pneumonia", "COVID"]
+                    class_names = covid_model.CLASS_NAMES
                     predicted_label = class_names[predicted_class]
+                    record_prediction('covid', {'image_sha256': hashlib.sha256(uploaded_file.getvalue()).hexdigest()},
+                                      covid_model.classifier_version(), predicted_label, latency_ms)
 
                     # Display the result
                     if predicted_label == "Normal":
@@ -585,10 +423,51 @@ def main_app():
                     st.subheader("Prediction Probabilities:")
                     for i, prob in enumerate(prediction[0]):
                         st.write(f"{class_names[i]}: {prob * 100:.2f}%")
+
+                    # Nearest indexed cases, from the features of the same forward pass
+                    show_similar_cases(embeddings)
                 except Exception as e:
                     st.error(f"An error occurred during prediction: {str(e)}")
+        elif len(uploaded_files) > 1:
+            st.write(f"{len(uploaded_files)} images uploaded.")
+            if st.button("Classify Images"):
+                try:
+                    started = time.perf_counter()
+                    probabilities = predictors.predict_images([uploaded_file.getvalue() for uploaded_file in uploaded_files])
+                    latency_ms = (time.perf_counter() - started) * 1000 / len(uploaded_files)
+                    version = covid_model.classifier_version()
+                    results = []
+                    for uploaded_file, probs in zip(uploaded_files, probabilities):
+                        row = {'Image': uploaded_file.name, 'Classification': covid_model.CLASS_NAMES[int(np.argmax(probs))]}
+                        record_prediction('covid', {'image_sha256': hashlib.sha256(uploaded_file.getvalue()).hexdigest()},
+                                          version, row['Classification'], latency_ms)
+                        row.update({name: f"{p * 100:.2f}%" for name, p in zip(covid_model.CLASS_NAMES, probs)})
+                        results.append(row)
+                    st.table(results)
+                except Exception as e:
+                    st.error(f"An error occurred during prediction: {str(e)}")
+    elif selected == 'Full Screening':
+        st.subheader("Full Screening")
+        st.write("Screen one patient against every model at once. Shared fields such as age are entered once; "
+                 "diseases with blank fields are skipped, and the X-ray is classified when one is attached.")
+
+        screening_form()
+    elif selected == 'Prediction History':
+        st.subheader("Prediction History")
+        st.caption("Predictions are saved in the background, so the latest ones can take a few seconds to appear.")
+        history_page()
+    elif selected == 'Input Drift':
+        st.subheader("Input Drift")
+        st.write("How far recent inputs are from the data each model was trained on. Older inputs count less over time.")
+        drift_page()
 # Run the app
-if not st.session_state['logged_in']:
-    login_signup_page()
-else:
-    main_app()
\ No newline at end of file
+start_metrics_server()
+start_warmup()
+# The signed session token is checked on every rerun without a database round-trip; expired sessions log in again
+if st.session_state['logged_in'] and auth.verify_token(st.session_state.get('auth_token')) is None:
+    st.session_state['logged_in'] = False
+with instrumentation.profile_request('streamlit'), instrumentation.span('request.streamlit'):
+    if not st.session_state['logged_in']:
+        login_signup_page()
+    else:
+        main_app()
\ No newline at end of file
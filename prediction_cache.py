@@ -0,0 +1,74 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+# Bounded LRU cache with a time-to-live, shared by all sessions, with hit/miss/eviction counters
+class PredictionCache:
+    def __init__(self, maxsize=10000, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expiry time, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # Function to look up a key; returns (found, value)
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Function to return the cached value for a key, or compute and cache it
+    def get_or_compute(self, key, compute):
+        found, value = self.get(key)
+        if not found:
+            # Computed outside the lock so a slow model call never blocks other lookups
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+# Function to build the cache key of a tabular prediction from the model version and the feature vector.
+# Values are canonicalised to floats so '5', 5 and 5.0 map to the same entry.
+def tabular_key(disease, model_version, values):
+    return (disease, model_version, tuple(float(v) for v in values))
+
+
+# Function to build the cache key of an image prediction from the model version and the uploaded bytes
+def image_key(model_version, data):
+    return ('covid', model_version, hashlib.sha256(data).hexdigest())
@@ -0,0 +1,239 @@
+import io
+import os
+import threading
+
+import numpy as np
+
+import covid_model
+import drift
+import instrumentation
+import micro_batcher
+import model_registry
+import prediction_cache
+import similar_cases
+import validation
+
+# Shared, process-wide state; created on first use
+_cache = None
+_classifier = None
+_drift_monitor = None
+_similar_index = None
+_lock = threading.Lock()
+
+
+# Function to get the prediction cache (PREDICTION_CACHE_SIZE entries, PREDICTION_CACHE_TTL seconds)
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = prediction_cache.PredictionCache(
+                    maxsize=int(os.environ.get('PREDICTION_CACHE_SIZE', '10000')),
+                    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', '3600')),
+                )
+    return _cache
+
+
+# Function to get the COVID-19 classifier for the backend selected by COVID_BACKEND. Concurrent
+# requests are batched together by a MicroBatcher (COVID_MAX_BATCH images, COVID_MAX_WAIT_MS);
+# COVID_MAX_BATCH=1 turns batching off.
+def get_covid_classifier(model_path="covid.h5"):
+    global _classifier
+    if _classifier is None:
+        with _lock:
+            if _classifier is None:
+                with instrumentation.span('model_load.covid'):
+                    classifier = covid_model.load_classifier(model_path)
+                max_batch_size = int(os.environ.get('COVID_MAX_BATCH', '16'))
+                if max_batch_size > 1:
+                    classifier = micro_batcher.MicroBatcher(
+                        classifier,
+                        max_batch_size=max_batch_size,
+                        max_wait=float(os.environ.get('COVID_MAX_WAIT_MS', '10')) / 1000,
+                    )
+                _classifier = classifier
+    return _classifier
+
+
+# Function to get the input-drift monitor of this process (configured by DRIFT_* environment variables, see drift.py)
+def get_drift_monitor():
+    global _drift_monitor
+    if _drift_monitor is None:
+        with _lock:
+            if _drift_monitor is None:
+                _drift_monitor = drift.create_monitor_from_env()
+    return _drift_monitor
+
+
+# Function to load models on a background thread, so the first request does not wait for them.
+# targets is 'all' or a comma-separated list of diseases and 'covid' (APP_WARMUP in the app).
+def start_warmup(targets):
+    if targets.strip() == 'all':
+        targets = list(validation.SCHEMAS) + ['covid']
+    else:
+        targets = [t.strip() for t in targets.split(',') if t.strip()]
+    thread = threading.Thread(target=_warm, args=(targets,), name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def _warm(targets):
+    for target in targets:
+        try:
+            with instrumentation.span(f'warmup.{target}'):
+                if target == 'covid':
+                    get_covid_classifier()
+                    get_similar_case_index()
+                else:
+                    model_registry.get_model(target)
+                    model_registry.get_calibrator(target)
+        except Exception:
+            instrumentation.count(f'warmup.{target}.failed')
+
+
+# Function to collect the runtime counters of the prediction cache and, once loaded, the COVID-19 micro-batcher
+def get_stats():
+    stats = {'cache': get_cache().stats()}
+    if isinstance(_classifier, micro_batcher.MicroBatcher):
+        stats['covid_batcher'] = _classifier.stats()
+    return stats
+
+
+# Function to convert one record into a feature row. A record is either a list of values in model
+# order or a dict keyed by form keys (e.g. 'fo') or CSV column names (e.g. 'MDVP:Fo(Hz)').
+# Missing or non-numeric values become NaN and are reported by validation.
+def parse_record(disease, record):
+    schema = validation.SCHEMAS[disease]
+    if isinstance(record, dict):
+        record = [record.get(field.key, record.get(field.column)) for field in schema]
+    if len(record) != len(schema):
+        raise ValueError(f"Expected {len(schema)} values for {disease}, got {len(record)}")
+    row = np.full(len(schema), np.nan)
+    for j, value in enumerate(record):
+        try:
+            row[j] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return row
+
+
+# Function to predict a tabular disease for a (rows, fields) array.
+# Returns the predictions (-1 for rows that failed validation) and the invalid-cell mask.
+# A single row (a form submission) goes through the prediction cache; larger batches are scored with one
+# predict call and left out of the cache, so a bulk request neither pays a per-row lookup nor evicts
+# the entries of interactive users.
+def predict_tabular(disease, X):
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    with instrumentation.span(f'validate.{disease}'):
+        invalid = validation.validate(disease, X)
+    predictions = np.full(len(X), -1, dtype=np.int64)
+    rows = np.flatnonzero(~invalid.any(axis=1))
+    if rows.size:
+        if drift.ENABLED:
+            get_drift_monitor().observe(disease, X[rows])
+        model = model_registry.get_model(disease)
+        if len(X) == 1:
+            key = prediction_cache.tabular_key(disease, model_registry.get_version(disease), X[0])
+            predictions[0] = get_cache().get_or_compute(key, lambda: int(_predict_rows(disease, model, X)[0]))
+        else:
+            predictions[rows] = _predict_rows(disease, model, X[rows])
+    return predictions, invalid
+
+
+def _predict_rows(disease, model, X):
+    with instrumentation.span(f'predict.{disease}'):
+        values = model.predict(X)
+    instrumentation.count(f'predictions.{disease}.computed', len(X))
+    return values
+
+
+# Function to get the operating threshold of a disease: RISK_THRESHOLD_<DISEASE> (e.g. RISK_THRESHOLD_HEART=0.3)
+# if set, otherwise the threshold tuned when the calibrator was fitted
+def risk_threshold(disease):
+    value = os.environ.get(f'RISK_THRESHOLD_{disease.upper()}')
+    if value is not None:
+        return float(value)
+    calibrator = model_registry.get_calibrator(disease)
+    return calibrator.threshold if calibrator is not None else 0.5
+
+
+# Function to score calibrated risk for a (rows, fields) array with one decision_function call.
+# Returns the risks (NaN for rows that failed validation), the flags (risk >= threshold, -1 when
+# invalid) and the invalid-cell mask. Raises LookupError if the disease has no calibrator.
+def predict_risk(disease, X):
+    calibrator = model_registry.get_calibrator(disease)
+    if calibrator is None:
+        raise LookupError(f"No calibration for {disease}; run `python calibration.py {disease}`")
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    with instrumentation.span(f'validate.{disease}'):
+        invalid = validation.validate(disease, X)
+    risks = np.full(len(X), np.nan)
+    flags = np.full(len(X), -1, dtype=np.int64)
+    rows = np.flatnonzero(~invalid.any(axis=1))
+    if rows.size:
+        model = model_registry.get_model(disease)
+        with instrumentation.span(f'risk.{disease}'):
+            risks[rows] = calibrator.predict_proba(model.decision_function(X[rows]))
+        flags[rows] = risks[rows] >= risk_threshold(disease)
+        instrumentation.count(f'risk.{disease}.computed', rows.size)
+    return risks, flags, invalid
+
+
+# Function to classify images given as encoded bytes; returns a (n, classes) probability array
+def predict_images(datas):
+    return classify_images(datas)[0]
+
+
+# Function to classify images given as encoded bytes and get their embeddings from the same forward pass.
+# Returns ((n, classes) probabilities, (n, features) embeddings, or None when the backend has none).
+# Images already in the cache are not classified again; the rest go through the model in batches.
+def classify_images(datas):
+    cache = get_cache()
+    version = covid_model.classifier_version()
+    keys = [prediction_cache.image_key(version, data) for data in datas]
+    results = [cache.get(key)[1] for key in keys]  # (probabilities, float16 embedding or None)
+    missing = [i for i, result in enumerate(results) if result is None]
+    instrumentation.count('predictions.covid.cached', len(datas) - len(missing))
+    if missing:
+        with instrumentation.span('preprocess_image'):
+            images = covid_model.load_images([io.BytesIO(datas[i]) for i in missing])
+        classifier = get_covid_classifier()
+        with instrumentation.span('predict.covid'):
+            probabilities, embeddings = classifier.predict_with_embeddings(images)
+        instrumentation.count('predictions.covid.computed', len(missing))
+        for j, i in enumerate(missing):
+            results[i] = (probabilities[j], None if embeddings is None else embeddings[j].astype(np.float16))
+            cache.put(keys[i], results[i])
+    if not results:
+        return np.empty((0, len(covid_model.CLASS_NAMES)), dtype=np.float32), None
+    probabilities = np.stack([probs for probs, _ in results])
+    if any(embedding is None for _, embedding in results):
+        return probabilities, None
+    return probabilities, np.stack([embedding for _, embedding in results]).astype(np.float32)
+
+
+# Function to get the similar-case index in SIMILAR_CASES_DIR (default similar_cases/), or None if none was built
+def get_similar_case_index():
+    global _similar_index
+    if _similar_index is None:
+        directory = os.environ.get('SIMILAR_CASES_DIR', 'similar_cases')
+        if not os.path.exists(os.path.join(directory, similar_cases.INDEX_FILE)):
+            return None
+        with _lock:
+            if _similar_index is None:
+                with instrumentation.span('index_load.similar_cases'):
+                    _similar_index = similar_cases.SimilarCaseIndex(
+                        directory, nprobe=int(os.environ.get('SIMILAR_CASES_NPROBE', '16')), read_only=True)
+    return _similar_index
+
+
+# Function to find the k most similar indexed cases of each embedding; returns one list of case dicts
+# per embedding, or None when no index was built or the backend gives no embeddings
+def find_similar(embeddings, k=5):
+    index = get_similar_case_index()
+    if index is None or embeddings is None:
+        return None
+    if index.refresh():  # cases added by `python similar_cases.py add` since the last search
+        instrumentation.count('similar_cases.reloaded')
+    with instrumentation.span('similar_cases.search'):
+        return index.search(embeddings, k)
@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import covid_model
+import predictors
+import validation
+
+# Fields that mean the same thing in several schemas are entered once: screening key -> {disease: field key}
+SHARED_FIELDS = {
+    'age': {'diabetes': 'Age', 'heart': 'age'},
+}
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('SCREENING_WORKERS', '4')), thread_name_prefix='screening')
+
+
+def _shared_key(disease, field_key):
+    for key, mapping in SHARED_FIELDS.items():
+        if mapping.get(disease) == field_key:
+            return key
+    return None
+
+
+# Function to list the union of all tabular schemas as (screening key, field, diseases) with shared fields once
+def union_fields():
+    fields = []
+    seen = set()
+    for disease, schema in validation.SCHEMAS.items():
+        for field in schema:
+            key = _shared_key(disease, field.key)
+            if key is None:
+                fields.append((f"{disease}.{field.key}", field, [disease]))
+            elif key not in seen:
+                seen.add(key)
+                fields.append((key, field, list(SHARED_FIELDS[key])))
+    return fields
+
+
+# Function to map screening inputs onto one disease's form keys; returns None if any field was left blank
+def disease_inputs(disease, inputs):
+    values = {}
+    for field in validation.SCHEMAS[disease]:
+        key = _shared_key(disease, field.key) or f"{disease}.{field.key}"
+        value = inputs.get(key)
+        if value is None or str(value).strip() == '':
+            return None
+        values[field.key] = value
+    return values
+
+
+def _score_tabular(disease, values):
+    predictions, invalid = predictors.predict_tabular(disease, values)
+    if invalid.any():
+        return {'status': 'invalid', 'errors': validation.row_errors(disease, values[0], invalid[0])}
+    return {'status': 'positive' if predictions[0] == 1 else 'negative', 'errors': []}
+
+
+def _score_image(data):
+    probs = predictors.predict_images([data])[0]
+    return {
+        'status': covid_model.CLASS_NAMES[int(np.argmax(probs))],
+        'probabilities': {name: float(p) for name, p in zip(covid_model.CLASS_NAMES, probs)},
+    }
+
+
+# Function to screen one patient against every model that has complete inputs, all at the same time.
+# Returns {disease: result}; diseases with blank fields are reported as 'skipped'.
+def screen(inputs, image_bytes=None):
+    futures = {}
+    report = {}
+    for disease in validation.SCHEMAS:
+        values = disease_inputs(disease, inputs)
+        if values is None:
+            report[disease] = {'status': 'skipped', 'errors': []}
+        else:
+            futures[disease] = _executor.submit(_score_tabular, disease, validation.parse_inputs(disease, values))
+    if image_bytes:
+        futures['covid'] = _executor.submit(_score_image, image_bytes)
+
+    for disease, future in futures.items():
+        try:
+            report[disease] = future.result()
+        except Exception as e:
+            report[disease] = {'status': 'error', 'errors': [str(e)]}
+    order = list(validation.SCHEMAS) + ['covid']
+    return {disease: report[disease] for disease in order if disease in report}
@@ -0,0 +1,373 @@
+import argparse
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import covid_model
+
+# Files of a similar-case index directory. Each train() writes a new generation of the trained files
+# under new names, so files another process has memory-mapped are never rewritten.
+INDEX_FILE = 'index.json'
+EMBEDDINGS_FILE = 'embeddings.npy'
+REDUCED_FILE = 'reduced-{}.npy'
+ASSIGNMENTS_FILE = 'assignments-{}.npy'
+PROJECTION_FILE = 'projection-{}.npz'
+CASES_FILE = 'cases.csv'
+CASE_FIELDS = ('source', 'label', 'predicted', 'confidence')
+
+
+# Function to scale each row to unit length, so a dot product is the cosine similarity
+def normalize(X):
+    X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+    return X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+
+
+# Function to get the index of the most similar centroid for each row, a chunk of rows at a time
+def _nearest(X, centroids, chunk=65536):
+    return np.concatenate([np.argmax(X[i:i + chunk] @ centroids.T, axis=1) for i in range(0, len(X), chunk)])
+
+
+# Function to cluster unit vectors with spherical k-means; returns (k, dim) unit centroids
+def _kmeans(X, k, iterations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = X[rng.choice(len(X), k, replace=False)]
+    for _ in range(iterations):
+        assignments = _nearest(X, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, X)
+        empty = np.bincount(assignments, minlength=k) == 0
+        sums[empty] = X[rng.choice(len(X), int(empty.sum()), replace=False)]  # restart empty clusters
+        centroids = normalize(sums)
+    return centroids
+
+
+# Function to copy the first `rows` rows of a memory-mapped array into a larger file that replaces the
+# one at `path`; processes still mapping the old file keep reading it unchanged
+def _grow(path, array, rows, capacity):
+    tmp_path = path + '.tmp'
+    grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=array.dtype, shape=(capacity,) + array.shape[1:])
+    grown[:rows] = array[:rows]
+    grown.flush()
+    del grown
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r+')
+
+
+# Embeddings of previously classified X-rays with a top-k cosine-similarity search.
+# The full embeddings are kept as float16 in a memory-mapped file. Once train() has run, each one also has a
+# PCA-reduced float16 copy and belongs to one of `nlist` k-means clusters (an inverted-file index): a query is
+# compared with the centroids, only the rows of the `nprobe` closest clusters are scored on the reduced
+# vectors, and the best candidates are re-ranked on the full embeddings. A query then touches a few thousand
+# rows however large the corpus gets. Before training (small corpora) every row is scored.
+# add() appends to all files, growing them by doubling, so new cases are searchable straight away.
+# Serving processes open the index with read_only=True: the files are mapped read-only and add()/train()
+# are refused, so only the process that writes the index (e.g. `python similar_cases.py add`) changes them.
+# They call refresh() before searching, which reloads whatever the writer changed once index.json is replaced.
+class SimilarCaseIndex:
+    def __init__(self, directory, nprobe=16, rerank=40, read_only=False):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()  # one reload at a time; it reads from the state of the last one
+        self.header = {'size': 0, 'capacity': 0, 'dim': None, 'trained': False}
+        self.cases = []
+        self._embeddings = self._reduced = self._assignments = None
+        self._mean = self._components = self._centroids = None
+        self._lists = []
+        self._cases_offset = 0  # bytes of cases.csv read into self.cases
+        self._stamp = None  # (inode, mtime) of the index.json loaded last
+        if os.path.exists(self._path(INDEX_FILE)):
+            self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def __len__(self):
+        return self.header['size']
+
+    def _index_stamp(self):
+        stat = os.stat(self._path(INDEX_FILE))
+        return stat.st_ino, stat.st_mtime_ns
+
+    # Function to (re)load the index from disk. Only what changed since the last load is read: new case rows
+    # from the end of cases.csv, new rows of the inverted lists, and the projection only after a retrain.
+    def _load(self):
+        stamp = self._index_stamp()
+        with open(self._path(INDEX_FILE)) as f:
+            header = json.load(f)
+        size = header['size']
+        mode = 'r' if self.read_only else 'r+'
+        embeddings = np.load(self._path(EMBEDDINGS_FILE), mmap_mode=mode)
+        cases_path = self._path(CASES_FILE)
+        header.setdefault('cases_bytes', os.path.getsize(cases_path))  # indexes written before it was recorded
+        if not self.read_only and os.path.getsize(cases_path) > header['cases_bytes']:
+            os.truncate(cases_path, header['cases_bytes'])  # rows of an add interrupted before the header was saved
+        with open(cases_path, 'rb') as f:
+            f.seek(self._cases_offset)
+            text = f.read(header['cases_bytes'] - self._cases_offset).decode('utf-8')
+        new_cases = list(csv.DictReader(io.StringIO(text, newline=''), CASE_FIELDS if self._cases_offset else None))
+        new_cases = new_cases[:size - len(self.cases)]
+        trained = None
+        if header['trained']:
+            generation = header['generation']
+            reduced = np.load(self._path(REDUCED_FILE.format(generation)), mmap_mode=mode)
+            assignments = np.load(self._path(ASSIGNMENTS_FILE.format(generation)), mmap_mode=mode)
+            projection = None
+            if generation != self.header.get('generation'):
+                with np.load(self._path(PROJECTION_FILE.format(generation))) as data:
+                    projection = data['mean'], data['components'], data['centroids']
+            trained = reduced, assignments, projection
+
+        with self._lock:
+            previous_size = self.header['size']
+            self._embeddings = embeddings
+            self.cases.extend(new_cases)
+            if trained is not None:
+                self._reduced, self._assignments, projection = trained
+                if projection is not None:
+                    self._mean, self._components, self._centroids = projection
+                    self._build_lists(self._assignments[:size])
+                else:
+                    self._extend_lists(previous_size, self._assignments[previous_size:size])
+            self.header = header
+            self._cases_offset = header['cases_bytes']
+            self._stamp = stamp
+
+    # Function to pick up cases added and retraining done by another process (e.g. `python similar_cases.py add`
+    # while the app serves the index); costs one stat of index.json when nothing changed. Returns True on reload.
+    def refresh(self):
+        try:
+            if self._index_stamp() == self._stamp:
+                return False
+            with self._refresh_lock:
+                if self._index_stamp() == self._stamp:
+                    return False  # reloaded by another thread while this one waited
+                self._load()
+        except (OSError, ValueError, KeyError):
+            return False  # caught between two writes of the other process; retried on the next call
+        return True
+
+    def _save_header(self):
+        self.header['updated_at'] = time.time()
+        with open(self._path(INDEX_FILE) + '.tmp', 'w') as f:
+            json.dump(self.header, f, indent=2)
+        os.replace(self._path(INDEX_FILE) + '.tmp', self._path(INDEX_FILE))
+        self._stamp = self._index_stamp()
+
+    # Function to group row ids by cluster: one sorted id array per inverted list
+    def _build_lists(self, assignments):
+        order = np.argsort(assignments, kind='stable')
+        bounds = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+        self._lists = [order[bounds[c]:bounds[c + 1]] for c in range(len(self._centroids))]
+
+    # Function to add rows start, start + 1, ... with the given cluster assignments to the inverted lists
+    def _extend_lists(self, start, assignments):
+        for c in np.unique(assignments):
+            self._lists[c] = np.concatenate([self._lists[c], start + np.flatnonzero(assignments == c)])
+
+    def _project(self, X):
+        return normalize((X - self._mean) @ self._components.T)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError(f"The similar-case index in {self.directory} was opened read-only")
+
+    def _ensure_capacity(self, rows, dim):
+        if self._embeddings is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.header.update(dim=dim, capacity=max(1024, rows))
+            self._embeddings = np.lib.format.open_memmap(self._path(EMBEDDINGS_FILE), mode='w+', dtype=np.float16,
+                                                         shape=(self.header['capacity'], dim))
+            with open(self._path(CASES_FILE), 'w', newline='') as f:
+                csv.writer(f).writerow(CASE_FIELDS)
+            self._cases_offset = self.header['cases_bytes'] = os.path.getsize(self._path(CASES_FILE))
+            return
+        if dim != self.header['dim']:
+            raise ValueError(f"Embeddings have {dim} features, the index has {self.header['dim']}")
+        size, capacity = self.header['size'], self.header['capacity']
+        if size + rows <= capacity:
+            return
+        capacity = max(2 * capacity, size + rows)
+        self._embeddings = _grow(self._path(EMBEDDINGS_FILE), self._embeddings, size, capacity)
+        if self.header['trained']:
+            generation = self.header['generation']
+            self._reduced = _grow(self._path(REDUCED_FILE.format(generation)), self._reduced, size, capacity)
+            self._assignments = _grow(self._path(ASSIGNMENTS_FILE.format(generation)), self._assignments, size, capacity)
+        self.header['capacity'] = capacity
+
+    # Function to append (n, features) embeddings with one case dict each (keys from CASE_FIELDS)
+    def add(self, embeddings, cases, model_version=None):
+        self._check_writable()
+        embeddings = normalize(embeddings)
+        cases = [{field: case.get(field, '') for field in CASE_FIELDS} for case in cases]
+        if len(cases) != len(embeddings):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(cases)} cases")
+        if not cases:
+            return
+        with self._lock:
+            self._ensure_capacity(len(embeddings), embeddings.shape[1])
+            start = self.header['size']
+            stop = start + len(embeddings)
+            self._embeddings[start:stop] = embeddings
+            self._embeddings.flush()
+            if self.header['trained']:
+                reduced = self._project(embeddings)
+                assignments = _nearest(reduced, self._centroids)
+                self._reduced[start:stop] = reduced
+                self._assignments[start:stop] = assignments
+                self._reduced.flush()
+                self._assignments.flush()
+                self._extend_lists(start, assignments)
+            with open(self._path(CASES_FILE), 'a', newline='') as f:
+                csv.DictWriter(f, CASE_FIELDS).writerows(cases)
+            self.cases.extend(cases)
+            self._cases_offset = self.header['cases_bytes'] = os.path.getsize(self._path(CASES_FILE))
+            self.header['size'] = stop
+            if model_version is not None:
+                self.header['model_version'] = model_version
+            self._save_header()
+
+    # Function to fit the PCA projection and the k-means clusters on a sample of the embeddings and index
+    # every row into a new generation of files. nlist defaults to about 4 * sqrt(size) clusters.
+    def train(self, reduced_dim=256, nlist=None, sample=20000, seed=0):
+        self._check_writable()
+        with self._lock:
+            size = self.header['size']
+            nlist = nlist or int(np.clip(4 * np.sqrt(size), 1, 4096))
+            if size < max(nlist, reduced_dim):
+                raise ValueError(f"Need at least {max(nlist, reduced_dim)} cases to train, the index has {size}")
+            rng = np.random.default_rng(seed)
+            rows = np.sort(rng.choice(size, min(sample, size), replace=False))
+            X = self._embeddings[rows].astype(np.float32)
+            self._mean = X.mean(axis=0)
+            self._components = np.linalg.svd(X - self._mean, full_matrices=False)[2][:reduced_dim].astype(np.float32)
+            self._centroids = _kmeans(self._project(X), nlist, seed=seed)
+
+            capacity = self.header['capacity']
+            previous = self.header.get('generation') if self.header['trained'] else None
+            generation = (previous or 0) + 1
+            self._reduced = np.lib.format.open_memmap(self._path(REDUCED_FILE.format(generation)), mode='w+',
+                                                      dtype=np.float16, shape=(capacity, len(self._components)))
+            self._assignments = np.lib.format.open_memmap(self._path(ASSIGNMENTS_FILE.format(generation)), mode='w+',
+                                                          dtype=np.int32, shape=(capacity,))
+            for start in range(0, size, 65536):
+                stop = min(start + 65536, size)
+                self._reduced[start:stop] = self._project(self._embeddings[start:stop].astype(np.float32))
+                self._assignments[start:stop] = _nearest(self._reduced[start:stop], self._centroids)
+            self._reduced.flush()
+            self._assignments.flush()
+            np.savez(self._path(PROJECTION_FILE.format(generation)),
+                     mean=self._mean, components=self._components, centroids=self._centroids)
+            self._build_lists(self._assignments[:size])
+            self.header.update(trained=True, generation=generation, nlist=nlist, reduced_dim=len(self._components),
+                               trained_size=size)
+            self._save_header()
+            # Readers switch to the new generation when they see the header; the old files stay readable
+            # through their existing maps after being unlinked
+            if previous is not None:
+                for name in (REDUCED_FILE, ASSIGNMENTS_FILE, PROJECTION_FILE):
+                    os.remove(self._path(name.format(previous)))
+
+    # Function to score a set of rows on the full embeddings; returns (top-k scores, row ids), best first
+    def _exact(self, query, rows, k):
+        scores = self._embeddings[rows].astype(np.float32) @ query
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return scores[top], rows[top]
+
+    # Function to find the k most similar cases for each query embedding; returns one list per query of
+    # case dicts with their row `id` and cosine `similarity`
+    def search(self, queries, k=5):
+        queries = normalize(queries)
+        results = []
+        with self._lock:
+            size = self.header['size']
+            for query in queries:
+                if size == 0:
+                    results.append([])
+                    continue
+                if self.header['trained']:
+                    scores, ids = self._search_ivf(query, k)
+                else:
+                    best = [self._exact(query, np.arange(start, min(start + 65536, size)), k)
+                            for start in range(0, size, 65536)]
+                    scores, ids = np.concatenate([b[0] for b in best]), np.concatenate([b[1] for b in best])
+                    top = np.argsort(-scores, kind='stable')[:k]
+                    scores, ids = scores[top], ids[top]
+                results.append([dict(self.cases[i], id=int(i), similarity=float(s)) for s, i in zip(scores, ids)])
+        return results
+
+    def _search_ivf(self, query, k):
+        reduced = self._project(query[np.newaxis])[0]
+        probes = np.argsort(-(self._centroids @ reduced))[:self.nprobe]
+        candidates = np.concatenate([self._lists[c] for c in probes])
+        if len(candidates) == 0:
+            return np.empty(0, np.float32), np.empty(0, np.int64)
+        candidates.sort()  # sequential reads from the memory maps
+        scores = self._reduced[candidates].astype(np.float32) @ reduced
+        keep = min(len(candidates), k * self.rerank)
+        shortlist = np.sort(candidates[np.argpartition(-scores, keep - 1)[:keep]])
+        return self._exact(query, shortlist, k)
+
+
+# Function to classify and embed every image under a directory (class sub-directories, as in covid_data.py,
+# or a flat folder) in chunks and add them to an index; returns the number of images added
+def add_directory(index, directory, model_path="covid.h5", batch_size=32, workers=None):
+    import covid_data
+    images = covid_data.list_dataset(directory) or [(path, None) for path in covid_model.list_images(directory)]
+    classifier = covid_model.load_classifier(model_path, batch_size)
+    version = covid_model.classifier_version(model_path)
+    chunk = batch_size * 8
+    for start in range(0, len(images), chunk):
+        part = images[start:start + chunk]
+        probabilities, embeddings = classifier.predict_with_embeddings(covid_model.load_images([p for p, _ in part], workers))
+        if embeddings is None:
+            raise ValueError("The classifier has no embeddings output; convert the TFLite model with --embeddings")
+        index.add(embeddings, [{
+            'source': os.path.abspath(path),
+            'label': '' if label is None else covid_model.CLASS_NAMES[label],
+            'predicted': covid_model.CLASS_NAMES[int(np.argmax(probs))],
+            'confidence': f"{float(np.max(probs)):.4f}",
+        } for (path, label), probs in zip(part, probabilities)], version)
+    return len(images)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Similar-case index of X-ray embeddings.')
+    parser.add_argument('--index-dir', default=os.environ.get('SIMILAR_CASES_DIR', 'similar_cases'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='Classify the images of a directory and add them to the index')
+    add.add_argument('directory', help='Directory with one sub-directory per class, or a flat folder of images')
+    add.add_argument('--model', default='covid.h5', help='Path to the Keras model')
+    add.add_argument('--batch-size', type=int, default=32)
+    add.add_argument('--workers', type=int, default=None, help='Threads used to decode images')
+    add.add_argument('--no-train', action='store_true', help='Do not (re)build the clusters afterwards')
+    train = commands.add_parser('train', help='Rebuild the PCA projection and clusters from the current cases')
+    train.add_argument('--dim', type=int, default=256, help='Dimensions of the reduced vectors')
+    train.add_argument('--nlist', type=int, default=None, help='Number of clusters (default about 4 * sqrt(cases))')
+    commands.add_parser('stats', help='Print the size of the index')
+    args = parser.parse_args(argv)
+
+    index = SimilarCaseIndex(args.index_dir)
+    if args.command == 'add':
+        start = time.perf_counter()
+        count = add_directory(index, args.directory, args.model, args.batch_size, args.workers)
+        print(f"Added {count} images in {time.perf_counter() - start:.1f}s")
+        # Clusters trained on a much smaller corpus stop balancing well; retrain once it has doubled
+        if not args.no_train and len(index) >= 1024 and len(index) >= 2 * index.header.get('trained_size', 0):
+            index.train()
+    elif args.command == 'train':
+        index.train(args.dim, args.nlist)
+    print(f"{len(index)} cases, {index.header.get('nlist', 0)} clusters, trained: {index.header['trained']} "
+          f"-> {args.index_dir}")
+
+
+if __name__ == '__main__':
+    main()
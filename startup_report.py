@@ -0,0 +1,99 @@
+import argparse
+import ast
+import json
+import re
+import subprocess
+import sys
+
+# Packages that should only be imported once their page or predictor is used
+HEAVY_MODULES = ('tensorflow', 'tflite_runtime', 'sklearn', 'scipy', 'pandas', 'pyodbc', 'joblib')
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$')
+
+# Runs in a fresh interpreter: import every module, then report what failed, what got loaded and the wall time
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+failed, seconds = {}, {}
+for name, fromlist in %r.items():
+    began = time.perf_counter()
+    try:
+        __import__(name, fromlist=fromlist)  # the import statement path, which -X importtime reports (importlib's is not)
+    except Exception as e:
+        failed[name] = f"{type(e).__name__}: {e}"
+    seconds[name] = time.perf_counter() - began
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'module_seconds': seconds,
+    'failed': failed,
+    'heavy_loaded': [m for m in %r if m in sys.modules],
+}))
+'''
+
+
+# Function to list the modules a script imports at top level, in order, as {module: names imported from it}
+def script_imports(path):
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    modules = {}
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                modules.setdefault(alias.name, [])
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.setdefault(node.module, []).extend(alias.name for alias in node.names)
+    return modules
+
+
+# Function to import modules in a fresh interpreter under -X importtime, in order, as the script would.
+# Returns the wall time, failed imports, heavy packages that got loaded, the time each requested
+# module added (dependencies already imported by an earlier module are not counted again) and the
+# modules with the most self time.
+def measure(modules, top=15):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE % (dict(modules), HEAVY_MODULES)],
+        capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    entries = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            entries.append((match.group(2), int(match.group(1))))
+    report['modules'] = [
+        {'module': name, 'ms': seconds * 1000}
+        for name, seconds in report.pop('module_seconds').items() if name not in report['failed']
+    ]
+    report['slowest_self'] = [
+        {'module': name, 'self_ms': own / 1000}
+        for name, own in sorted(entries, key=lambda e: e[1], reverse=True)[:top]
+    ]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show where import time goes when a script starts.')
+    parser.add_argument('script', nargs='?', default='multiplediseaseprediction.py',
+                        help='Script whose top-level imports are measured')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest modules to list')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = measure(script_imports(args.script), args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"Imports of {args.script}: {report['seconds'] * 1000:.0f} ms")
+    for entry in report['modules']:
+        print(f"  {entry['module']:<28} {entry['ms']:8.1f} ms")
+    for name, error in report['failed'].items():
+        print(f"  {name:<28} failed ({error})")
+    print("Slowest modules by self time:")
+    for entry in report['slowest_self']:
+        print(f"  {entry['module']:<40} {entry['self_ms']:8.1f} ms")
+    heavy = ', '.join(report['heavy_loaded']) or 'none'
+    print(f"Heavy packages loaded at startup: {heavy}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+import pytest
+
+import auth
+import db_pool
+
+
+@pytest.mark.parametrize('stored', ['pbkdf2_sha256$', 'pbkdf2_sha256$many$salt$hash', 'pbkdf2_sha256$0$AAAA$AAAA',
+                                    'pbkdf2_sha256$1000$c2FsdA$aGFzaA$extra'])
+def test_malformed_stored_value_fails_login(stored):
+    assert auth.verify_password('secret', stored) is False
+
+
+def test_plaintext_value_from_before_hashing_still_logs_in():
+    assert auth.verify_password('secret', 'secret')
+    assert not auth.verify_password('wrong', 'secret')
+    assert auth.needs_rehash('secret')
+
+
+def test_duplicate_sign_up_reports_taken_username(tmp_path):
+    pool = db_pool.ConnectionPool(db_pool.SQLiteBackend(str(tmp_path / 'users.db')))
+    auth.ensure_username_index(pool)
+    assert auth.create_user(pool, 'alice', 'first')
+    assert not auth.create_user(pool, 'alice', 'second')
+    assert auth.authenticate(pool, 'alice', 'first')
+    assert not auth.authenticate(pool, 'alice', 'second')
@@ -0,0 +1,39 @@
+import pytest
+
+import db_pool
+
+
+class BrokenRollbackConnection:
+    closed = False
+
+    def rollback(self):
+        raise ConnectionError("connection lost")
+
+    def close(self):
+        self.closed = True
+
+
+class BrokenRollbackBackend(db_pool.Backend):
+    dialect = 'sqlite'
+
+    def connect(self):
+        return BrokenRollbackConnection()
+
+
+def test_failed_rollback_keeps_the_original_error_and_drops_the_connection():
+    pool = db_pool.ConnectionPool(BrokenRollbackBackend(), size=1)
+    with pytest.raises(KeyError):
+        with pool.connection() as conn:
+            raise KeyError('original')
+    assert conn.closed
+    with pool.connection() as fresh:  # the slot was freed
+        assert fresh is not conn
+
+
+def test_connection_is_reused_after_a_rolled_back_error(tmp_path):
+    pool = db_pool.ConnectionPool(db_pool.SQLiteBackend(str(tmp_path / 'users.db')), size=1)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError('original')
+    with pool.connection() as again:
+        assert again is conn
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import drift
+import train
+import validation
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return drift.build_reference()
+
+
+# Training rows the forms accept as a whole, the population the monitor observes
+def _valid_rows(disease):
+    X = train.load_dataset(disease)[0].to_numpy(dtype=np.float64)
+    return X[~validation.validate(disease, X).any(axis=1)]
+
+
+def _status(disease, entry, X):
+    return drift.score_counts(disease, entry, drift.bin_counts(entry['edges'], X))['status']
+
+
+@pytest.mark.parametrize('disease', list(train.DATASETS))
+def test_training_data_does_not_alert(reference, disease):
+    X = _valid_rows(disease)
+    entry = reference[disease]
+    assert drift.score_counts(disease, entry, drift.bin_counts(entry['edges'], X), min_samples=0)['status'] == 'stable'
+    rng = np.random.default_rng(0)
+    statuses = [_status(disease, entry, X[rng.integers(0, len(X), 200)]) for _ in range(200)]
+    assert statuses.count('stable') >= 198
+
+
+@pytest.mark.parametrize('disease', list(train.DATASETS))
+def test_shifted_inputs_alert(reference, disease):
+    X = _valid_rows(disease)
+    rng = np.random.default_rng(0)
+    window = X[rng.integers(0, len(X), 200)]
+    window[:, 0] = validation.SCHEMAS[disease][0].max  # every input at the top of the first field's range
+    assert _status(disease, reference[disease], window) == 'major'
+
+
+def test_monitor_collects_then_scores(reference):
+    monitor = drift.DriftMonitor(reference, interval=3600)
+    try:
+        X = _valid_rows('heart')
+        monitor.observe('heart', X[:100])
+        assert monitor.update()['heart']['status'] == 'collecting'
+        monitor.observe('heart', X)
+        scores = monitor.update()['heart']
+        assert scores['status'] == 'stable'
+        assert len(scores['features']) == len(validation.SCHEMAS['heart'])
+    finally:
+        monitor.close()
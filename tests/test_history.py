@@ -0,0 +1,87 @@
+import sqlite3
+import time
+
+import db_pool
+import history
+
+
+class BrokenBackend(db_pool.Backend):
+    dialect = 'sqlite'
+
+    def connect(self):
+        raise sqlite3.OperationalError("database is unavailable")
+
+
+def _pool(path):
+    return db_pool.ConnectionPool(db_pool.SQLiteBackend(str(path)))
+
+
+def _rows(path, table='PredictionHistory'):
+    with sqlite3.connect(str(path)) as conn:
+        return conn.execute(f"SELECT Username, RecordId FROM {table}").fetchall()
+
+
+def _record(recorder, username):
+    recorder.record(username, 'heart', [1.0, 2.0], 'v1', 0, 1.5)
+
+
+def _fill_fallback(fallback, count):
+    recorder = history.HistoryRecorder(db_pool.ConnectionPool(BrokenBackend()), batch_size=10, flush_interval=0.01,
+                                       fallback_path=str(fallback))
+    for i in range(count):
+        _record(recorder, f'offline{i}')
+    recorder.close()
+    assert len(_rows(fallback)) == count
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_fallback_drains_under_steady_traffic(tmp_path):
+    fallback, database = tmp_path / 'fallback.db', tmp_path / 'history.db'
+    _fill_fallback(fallback, 50)
+    recorder = history.HistoryRecorder(_pool(database), batch_size=10, flush_interval=0.05, fallback_path=str(fallback))
+    try:
+        # A record every few milliseconds: no flush cycle is ever idle
+        deadline = time.monotonic() + 1.0
+        i = 0
+        while time.monotonic() < deadline:
+            _record(recorder, f'online{i}')
+            i += 1
+            time.sleep(0.005)
+        assert _wait_for(lambda: not _rows(fallback))
+    finally:
+        recorder.close()
+    rows = _rows(database)
+    assert len(rows) == 50 + i
+    assert len({record_id for _, record_id in rows}) == len(rows)
+
+
+def test_recorders_sharing_a_fallback_replay_each_record_once(tmp_path):
+    fallback, database = tmp_path / 'fallback.db', tmp_path / 'history.db'
+    _fill_fallback(fallback, 200)
+    pool = _pool(database)
+    history.ensure_schema(pool)
+    recorders = [history.HistoryRecorder(pool, batch_size=7, flush_interval=0.01, fallback_path=str(fallback))
+                 for _ in range(3)]
+    try:
+        assert _wait_for(lambda: not _rows(fallback))
+    finally:
+        for recorder in recorders:
+            recorder.close()
+    assert sorted(username for username, _ in _rows(database)) == sorted(f'offline{i}' for i in range(200))
+
+
+def test_writing_a_batch_twice_stores_it_once(tmp_path):
+    recorder = history.HistoryRecorder(_pool(tmp_path / 'history.db'), fallback_path=str(tmp_path / 'fallback.db'))
+    try:
+        row = ('alice', 'heart', '[1.0]', 'v1', '0', 1.0, '2024-01-01 00:00:00', 'a' * 32)
+        recorder._insert([row])
+        recorder._insert([row])  # e.g. a replay whose delete from the fallback file failed
+    finally:
+        recorder.close()
+    assert _rows(tmp_path / 'history.db') == [('alice', 'a' * 32)]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import numpy as np
+
+import similar_cases
+
+
+def _add(index, start, stop):
+    embeddings = np.random.default_rng(start).normal(size=(stop - start, 32)).astype(np.float32)
+    index.add(embeddings, [{'source': f'case{i}'} for i in range(start, stop)])
+    return embeddings
+
+
+def test_reader_picks_up_added_and_retrained_cases(tmp_path):
+    writer = similar_cases.SimilarCaseIndex(str(tmp_path))
+    _add(writer, 0, 300)
+    reader = similar_cases.SimilarCaseIndex(str(tmp_path), read_only=True)
+    assert not reader.refresh()
+    writer.train(reduced_dim=8, nlist=8)
+    added = _add(writer, 300, 320)
+    assert reader.refresh()
+    assert len(reader) == len(reader.cases) == 320
+    assert reader.search(added[5:6], 1)[0][0]['source'] == 'case305'
+
+
+def test_concurrent_refreshes_load_each_case_once(tmp_path):
+    writer = similar_cases.SimilarCaseIndex(str(tmp_path))
+    _add(writer, 0, 10)
+    reader = similar_cases.SimilarCaseIndex(str(tmp_path), read_only=True)
+    _add(writer, 10, 15)
+
+    # Hold each reload just before it commits what it read, so that reloads of the threads overlap
+    class SlowLock:
+        def __init__(self, lock):
+            self.lock = lock
+
+        def __enter__(self):
+            time.sleep(0.05)
+            return self.lock.__enter__()
+
+        def __exit__(self, *exc_info):
+            return self.lock.__exit__(*exc_info)
+    reader._lock = SlowLock(reader._lock)
+
+    barrier = threading.Barrier(8)
+
+    def refresh():
+        barrier.wait()
+        reader.refresh()
+    threads = [threading.Thread(target=refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(reader) == 15
+    assert [case['source'] for case in reader.cases] == [f'case{i}' for i in range(15)]
+    added = _add(writer, 15, 20)
+    assert reader.refresh()
+    assert [case['source'] for case in reader.cases] == [f'case{i}' for i in range(20)]
+    assert reader.search(added[2:3], 1)[0][0]['source'] == 'case17'
@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import pickle
+import platform
+import time
+
+import numpy as np
+import pandas as pd
+
+import calibration
+import linear_scorer
+import model_registry
+import validation
+
+# Training CSV and label column of each tabular disease
+DATASETS = {
+    'diabetes': ('diabetes.csv', 'Outcome'),
+    'heart': ('heart.csv', 'target'),
+    'parkinsons': ('parkinsons.csv', 'status'),
+}
+
+# Diseases whose notebook split the test set with stratify=Y (the Parkinsons notebook did not)
+STRATIFIED_SPLIT = ('diabetes', 'heart')
+
+# Model family and hyperparameter grid of each disease. The models stay linear (with the scaler folded
+# into the coefficients on export) so the NumPy scorer in linear_scorer.py can serve them.
+SEARCH_SPACES = {
+    'diabetes': ('svc', {'model__C': [0.01, 0.1, 1, 10], 'model__class_weight': [None, 'balanced']}),
+    'heart': ('logistic', {'model__C': [0.01, 0.1, 1, 10, 100], 'model__class_weight': [None, 'balanced']}),
+    'parkinsons': ('svc', {'model__C': [0.01, 0.1, 1, 10, 100], 'model__class_weight': [None, 'balanced']}),
+}
+
+
+# Function to load a training dataset, caching the parsed columns as .npz in .cache/, keyed on the CSV size and
+# modification time
+def load_dataset(disease, cache_dir='.cache'):
+    csv_path, label = DATASETS[disease]
+    columns = validation.columns(disease) + [label]
+    stat = os.stat(csv_path)
+    cache_path = os.path.join(cache_dir, f"{disease}-{stat.st_size}-{stat.st_mtime_ns}.npz")
+    try:
+        with np.load(cache_path) as cached:
+            data = pd.DataFrame({column: cached[column] for column in columns})
+    except (FileNotFoundError, KeyError):  # not cached yet, or cached before the columns changed
+        data = pd.read_csv(csv_path, encoding='utf-8-sig')[columns]
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path + '.tmp', 'wb') as f:
+            np.savez(f, **{column: data[column].to_numpy() for column in columns})
+        os.replace(cache_path + '.tmp', cache_path)  # training processes may load the same dataset at once
+    return data[validation.columns(disease)], data[label]
+
+
+def _pipeline(kind, seed):
+    from sklearn import svm
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    model = svm.SVC(kernel='linear') if kind == 'svc' else LogisticRegression(max_iter=5000, random_state=seed)
+    return Pipeline([('scaler', StandardScaler()), ('model', model)])
+
+
+# Function to fit one disease with a cross-validated grid search on n_jobs processes; returns (model, metrics)
+def train_disease(disease, n_jobs=-1, cv=5, seed=2):
+    from sklearn.metrics import accuracy_score, f1_score, roc_auc_score
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold, train_test_split
+
+    X, Y = load_dataset(disease)
+    # Same split as the original notebook of each disease, so the test metrics stay comparable
+    stratify = Y if disease in STRATIFIED_SPLIT else None
+    X_train, X_test, Y_train, Y_test = train_test_split(X, Y, test_size=0.2, stratify=stratify, random_state=seed)
+
+    kind, grid = SEARCH_SPACES[disease]
+    search = GridSearchCV(
+        _pipeline(kind, seed), grid, scoring='accuracy', n_jobs=n_jobs, refit=True,
+        cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed),
+    )
+    start = time.perf_counter()
+    search.fit(X_train, Y_train)
+    fit_seconds = time.perf_counter() - start
+
+    model = search.best_estimator_
+    scores = model.decision_function(X_test)
+    metrics = {
+        'disease': disease,
+        'model': kind,
+        'best_params': {k.replace('model__', ''): v for k, v in search.best_params_.items()},
+        'cv_accuracy': float(search.best_score_),
+        'train_accuracy': float(accuracy_score(Y_train, model.predict(X_train))),
+        'test_accuracy': float(accuracy_score(Y_test, model.predict(X_test))),
+        'test_f1': float(f1_score(Y_test, model.predict(X_test))),
+        'test_roc_auc': float(roc_auc_score(Y_test, scores)),
+        'train_rows': len(X_train),
+        'test_rows': len(X_test),
+        'search_seconds': fit_seconds,
+    }
+    return model, metrics
+
+
+# Function to write a versioned artifact directory: <output_dir>/<disease>/<version>/{model.sav, model.npz, metrics.json}
+def save_artifacts(disease, model, metrics, output_dir, version):
+    import sklearn
+    directory = os.path.join(output_dir, disease, version)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'model.sav'), 'wb') as f:
+        pickle.dump(model, f)
+    linear_scorer.LinearModel.from_sklearn(model).save(os.path.join(directory, 'model.npz'))
+    metrics = dict(metrics, version=version, sklearn=sklearn.__version__, python=platform.python_version())
+    with open(os.path.join(directory, 'metrics.json'), 'w') as f:
+        json.dump(metrics, f, indent=2)
+    return directory
+
+
+# Function to replace the models the app serves, refreshing any derived .npz/.joblib/calibration artifacts as well
+def install(disease, model, model_dir='.'):
+    with open(model_registry.model_path(disease, '.sav', model_dir), 'wb') as f:
+        pickle.dump(model, f)
+    npz_path = model_registry.model_path(disease, '.npz', model_dir)
+    if os.path.exists(npz_path):
+        linear_scorer.LinearModel.from_sklearn(model).save(npz_path)
+    joblib_path = model_registry.model_path(disease, '.joblib', model_dir)
+    if os.path.exists(joblib_path):
+        import joblib
+        joblib.dump(model, joblib_path)
+    calibration_path = calibration.calibration_path(disease, model_dir)
+    if os.path.exists(calibration_path):
+        method = calibration.Calibrator.load(calibration_path).method
+        calibration.fit_calibrator(disease, model, method)[0].save(calibration_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the tabular disease models with cross-validated search.')
+    parser.add_argument('diseases', nargs='*', help=f"Diseases to train: {', '.join(DATASETS)} (default: all)")
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Processes used by the search (-1 = all cores)')
+    parser.add_argument('--cv', type=int, default=5, help='Cross-validation folds')
+    parser.add_argument('--seed', type=int, default=2)
+    parser.add_argument('--output-dir', default='artifacts', help='Directory for versioned model artifacts')
+    parser.add_argument('--install', action='store_true', help='Also replace the models served by the app')
+    args = parser.parse_args(argv)
+    unknown = set(args.diseases) - set(DATASETS)
+    if unknown:
+        parser.error(f"unknown diseases: {', '.join(sorted(unknown))}")
+
+    version = time.strftime('%Y%m%d-%H%M%S')
+    for disease in args.diseases or DATASETS:
+        model, metrics = train_disease(disease, args.n_jobs, args.cv, args.seed)
+        directory = save_artifacts(disease, model, metrics, args.output_dir, version)
+        if args.install:
+            install(disease, model)
+        print(f"{disease:<11} test accuracy {metrics['test_accuracy']:.3f}  cv {metrics['cv_accuracy']:.3f}  "
+              f"{metrics['best_params']}  -> {directory}")
+
+
+if __name__ == '__main__':
+    main()
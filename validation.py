@@ -0,0 +1,170 @@
+from collections import namedtuple
+
+import numpy as np
+
+# One input field of a disease form.
+#   key     - key of the field in input dicts (parse_inputs, REST records)
+#   column  - column name in the training CSV (and feature name of the model)
+#   label   - name shown in error messages
+#   dtype   - int or float, as parsed by the form
+#   min/max - inclusive valid range
+#   allowed - optional set of allowed values for categorical fields
+#   prompt  - label of the form widget, when it differs from `label`
+#   help    - tooltip of the form widget
+Field = namedtuple('Field', ['key', 'column', 'label', 'dtype', 'min', 'max', 'allowed', 'prompt', 'help'],
+                   defaults=[None, None, None])
+
+SCHEMAS = {
+    'diabetes': [
+        Field('Pregnancies', 'Pregnancies', 'Number of Pregnancies', int, 0, 15,
+              help="Number of times the person has been pregnant (Normal: 0-15)"),
+        Field('Glucose', 'Glucose', 'Glucose level', int, 70, 200,
+              prompt='Glucose Level', help="Glucose level in the blood (mg/dL) (Normal: 70-140, Max: 200)"),
+        Field('BloodPressure', 'BloodPressure', 'Blood Pressure', int, 60, 120,
+              prompt='Blood Pressure value', help="Diastolic blood pressure (mm Hg) (Normal: 60-90, Max: 120)"),
+        Field('SkinThickness', 'SkinThickness', 'Skin Thickness', int, 10, 50,
+              prompt='Skin Thickness value', help="Thickness of the skin fold on the triceps (mm) (Normal: 10-30, Max: 50)"),
+        Field('Insulin', 'Insulin', 'Insulin level', int, 16, 846,
+              prompt='Insulin Level', help="2-Hour serum insulin (mu U/ml) (Normal: 16-166, Max: 846)"),
+        Field('BMI', 'BMI', 'BMI', float, 18.5, 60,
+              prompt='BMI value', help="Body Mass Index (weight in kg/(height in m)^2) (Normal: 18.5-24.9, Max: 60)"),
+        Field('DiabetesPedigreeFunction', 'DiabetesPedigreeFunction', 'Diabetes Pedigree Function', float, 0.078, 2.5,
+              prompt='Diabetes Pedigree Function value', help="A function that scores the likelihood of diabetes based on family history (Normal: 0.078-2.42, Max: 2.5)"),
+        Field('Age', 'Age', 'Age', int, 21, 120,
+              prompt='Age of the Person', help="Age in years (Normal: 21-81, Max: 120)"),
+    ],
+    'heart': [
+        Field('age', 'age', 'Age', int, 20, 120,
+              help="Age in years (Normal: 20-80, Max: 120)"),
+        Field('sex', 'sex', 'Sex', int, 0, 1, (0, 1),
+              help="Sex (1 = male; 0 = female)"),
+        Field('cp', 'cp', 'Chest Pain type', int, 0, 3, (0, 1, 2, 3),
+              prompt='Chest Pain types', help="Chest pain type (0 = typical angina; 1 = atypical angina; 2 = non-anginal pain; 3 = asymptomatic)"),
+        Field('trestbps', 'trestbps', 'Resting Blood Pressure', int, 80, 200,
+              help="Resting blood pressure (mm Hg) (Normal: 80-120, Max: 200)"),
+        Field('chol', 'chol', 'Cholesterol', int, 120, 600,
+              prompt='Serum Cholestoral in mg/dl', help="Serum cholesterol level (mg/dL) (Normal: 120-240, Max: 600)"),
+        Field('fbs', 'fbs', 'Fasting Blood Sugar', int, 0, 1, (0, 1),
+              prompt='Fasting Blood Sugar > 120 mg/dl', help="Fasting blood sugar > 120 mg/dL (1 = true; 0 = false)"),
+        Field('restecg', 'restecg', 'Resting ECG', int, 0, 2, (0, 1, 2),
+              prompt='Resting Electrocardiographic results', help="Resting electrocardiographic results (0 = normal; 1 = ST-T wave abnormality; 2 = probable or definite left ventricular hypertrophy)"),
+        Field('thalach', 'thalach', 'Maximum Heart Rate', int, 60, 220,
+              prompt='Maximum Heart Rate achieved', help="Maximum heart rate achieved during exercise (Normal: 60-100, Max: 220)"),
+        Field('exang', 'exang', 'Exercise Induced Angina', int, 0, 1, (0, 1),
+              help="Exercise-induced angina (1 = yes; 0 = no)"),
+        Field('oldpeak', 'oldpeak', 'ST Depression', float, 0, 6,
+              prompt='ST depression induced by exercise', help="ST depression induced by exercise relative to rest (Normal: 0-2, Max: 6)"),
+        Field('slope', 'slope', 'Slope', int, 0, 2, (0, 1, 2),
+              prompt='Slope of the peak exercise ST segment', help="Slope of the peak exercise ST segment (0 = upsloping; 1 = flat; 2 = downsloping)"),
+        Field('ca', 'ca', 'Major Vessels Colored', int, 0, 3,
+              prompt='Major vessels colored by fluoroscopy', help="Number of major vessels colored by fluoroscopy (0-3)"),
+        Field('thal', 'thal', 'Thalassemia', int, 0, 2, (0, 1, 2),
+              prompt='thal: 0 = normal; 1 = fixed defect; 2 = reversible defect', help="Thalassemia (0 = normal; 1 = fixed defect; 2 = reversible defect)"),
+    ],
+    'parkinsons': [
+        Field('fo', 'MDVP:Fo(Hz)', 'MDVP:Fo(Hz)', float, 85, 300,
+              help="Average vocal fundamental frequency (Normal: 85-260 Hz, Max: 300)"),
+        Field('fhi', 'MDVP:Fhi(Hz)', 'MDVP:Fhi(Hz)', float, 100, 600,
+              help="Maximum vocal fundamental frequency (Normal: 100-500 Hz, Max: 600)"),
+        Field('flo', 'MDVP:Flo(Hz)', 'MDVP:Flo(Hz)', float, 60, 200,
+              help="Minimum vocal fundamental frequency (Normal: 60-180 Hz, Max: 200)"),
+        Field('Jitter_percent', 'MDVP:Jitter(%)', 'MDVP:Jitter(%)', float, 0.001, 0.02,
+              help="Jitter as a percentage of the fundamental frequency (Normal: 0.001-0.01%, Max: 0.02%)"),
+        Field('Jitter_Abs', 'MDVP:Jitter(Abs)', 'MDVP:Jitter(Abs)', float, 1e-05, 0.0002,
+              help="Absolute jitter value (Normal: 0.00001-0.0001, Max: 0.0002)"),
+        Field('RAP', 'MDVP:RAP', 'MDVP:RAP', float, 0.001, 0.02,
+              help="Relative amplitude perturbation (Normal: 0.001-0.01, Max: 0.02)"),
+        Field('PPQ', 'MDVP:PPQ', 'MDVP:PPQ', float, 0.001, 0.02,
+              help="Five-point period perturbation quotient (Normal: 0.001-0.01, Max: 0.02)"),
+        Field('DDP', 'Jitter:DDP', 'Jitter:DDP', float, 0.001, 0.02,
+              help="Average absolute difference of differences between consecutive periods (Normal: 0.001-0.01, Max: 0.02)"),
+        Field('Shimmer', 'MDVP:Shimmer', 'MDVP:Shimmer', float, 0.01, 0.1,
+              help="Shimmer (amplitude variation) (Normal: 0.01-0.05, Max: 0.1)"),
+        Field('Shimmer_dB', 'MDVP:Shimmer(dB)', 'MDVP:Shimmer(dB)', float, 0.1, 1.0,
+              help="Shimmer in decibels (Normal: 0.1-0.5 dB, Max: 1.0)"),
+        Field('APQ3', 'Shimmer:APQ3', 'Shimmer:APQ3', float, 0.01, 0.1,
+              help="Amplitude perturbation quotient over three points (Normal: 0.01-0.05, Max: 0.1)"),
+        Field('APQ5', 'Shimmer:APQ5', 'Shimmer:APQ5', float, 0.01, 0.1,
+              help="Amplitude perturbation quotient over five points (Normal: 0.01-0.05, Max: 0.1)"),
+        Field('APQ', 'MDVP:APQ', 'MDVP:APQ', float, 0.01, 0.1,
+              help="Amplitude perturbation quotient (Normal: 0.01-0.05, Max: 0.1)"),
+        Field('DDA', 'Shimmer:DDA', 'Shimmer:DDA', float, 0.01, 0.1,
+              help="Average absolute difference between consecutive differences of amplitudes (Normal: 0.01-0.05, Max: 0.1)"),
+        Field('NHR', 'NHR', 'NHR', float, 0.01, 0.2,
+              help="Noise-to-harmonics ratio (Normal: 0.01-0.1, Max: 0.2)"),
+        Field('HNR', 'HNR', 'HNR', float, 20, 40,
+              help="Harmonics-to-noise ratio (Normal: 20-30 dB, Max: 40)"),
+        Field('RPDE', 'RPDE', 'RPDE', float, 0.1, 1.0,
+              help="Recurrence period density entropy (Normal: 0.1-0.6, Max: 1.0)"),
+        Field('DFA', 'DFA', 'DFA', float, 0.5, 2.0,
+              help="Detrended fluctuation analysis (Normal: 0.5-1.5, Max: 2.0)"),
+        Field('spread1', 'spread1', 'spread1', float, -7, 0,
+              help="Nonlinear measure of fundamental frequency variation (Normal: -7 to -2, Max: 0)"),
+        Field('spread2', 'spread2', 'spread2', float, 0.01, 0.3,
+              help="Nonlinear measure of fundamental frequency variation (Normal: 0.01-0.2, Max: 0.3)"),
+        Field('D2', 'D2', 'D2', float, 1.5, 3.0,
+              help="Correlation dimension (Normal: 1.5-2.5, Max: 3.0)"),
+        Field('PPE', 'PPE', 'PPE', float, 0.1, 1.0,
+              help="Pitch period entropy (Normal: 0.1-0.5, Max: 1.0)"),
+    ],
+}
+
+
+# Function to build the NumPy lookup tables used by validate() for one schema
+def _compile(schema):
+    return {
+        'min': np.array([f.min for f in schema], dtype=np.float64),
+        'max': np.array([f.max for f in schema], dtype=np.float64),
+        'integer': np.array([f.dtype is int for f in schema], dtype=bool),
+        'allowed': [(j, np.array(f.allowed, dtype=np.float64)) for j, f in enumerate(schema) if f.allowed],
+    }
+
+
+_TABLES = {disease: _compile(schema) for disease, schema in SCHEMAS.items()}
+
+
+# Function to get the training-CSV column names of a disease, in model order
+def columns(disease):
+    return [f.column for f in SCHEMAS[disease]]
+
+
+# Function to validate a (rows, fields) float array; returns a boolean mask of invalid cells
+def validate(disease, X):
+    table = _TABLES[disease]
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    with np.errstate(invalid='ignore'):
+        invalid = ~np.isfinite(X) | (X < table['min']) | (X > table['max'])
+        invalid |= table['integer'] & (X != np.floor(X))
+    for j, allowed in table['allowed']:
+        invalid[:, j] |= ~np.isin(X[:, j], allowed)
+    return invalid
+
+
+# Function to convert a dict of form strings into a (1, fields) float array; unparseable values become NaN
+def parse_inputs(disease, inputs):
+    values = np.full((1, len(SCHEMAS[disease])), np.nan)
+    for j, field in enumerate(SCHEMAS[disease]):
+        try:
+            values[0, j] = field.dtype(inputs[field.key])
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+# Function to build the error message for one invalid field value
+def error_message(field, value):
+    if not np.isfinite(value):
+        return f"Please enter a valid numeric value for {field.label}."
+    entered = int(value) if field.dtype is int and float(value).is_integer() else value
+    if field.allowed:
+        options = [str(v) for v in field.allowed]
+        if len(options) == 2:
+            return f"{field.label} must be either {options[0]} or {options[1]}. You entered: {entered}"
+        return f"{field.label} must be {', '.join(options[:-1])}, or {options[-1]}. You entered: {entered}"
+    return f"{field.label} must be between {field.min} and {field.max}. You entered: {entered}"
+
+
+# Function to list the error messages of every invalid field in one row
+def row_errors(disease, values, invalid):
+    schema = SCHEMAS[disease]
+    return [error_message(schema[j], values[j]) for j in np.flatnonzero(invalid)]